@@ -0,0 +1,33 @@
+"""Add conversation user/timestamp index
+
+Revision ID: 4f2a9c1d7e3b
+Revises: b503dc99cbab
+Create Date: 2026-10-15 09:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f2a9c1d7e3b'
+down_revision: Union[str, None] = 'b503dc99cbab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_conversations_timestamp', table_name='conversations')
+    op.create_index(
+        'ix_conv_user_ts',
+        'conversations',
+        ['user_id', sa.text('timestamp DESC')],
+        postgresql_using='btree'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conv_user_ts', table_name='conversations')
+    op.create_index('ix_conversations_timestamp', 'conversations', ['timestamp'])
@@ -0,0 +1,46 @@
+"""Store knowledge base embeddings as pgvector
+
+Revision ID: 8c3e5b7a2d14
+Revises: 4f2a9c1d7e3b
+Create Date: 2026-10-15 10:02:17.530961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3e5b7a2d14'
+down_revision: Union[str, None] = '4f2a9c1d7e3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS vector')
+    
+    # JSON arrays ("[0.1, 0.2, ...]") are valid vector literals
+    op.add_column('knowledge_base', sa.Column('embedding_v', Vector(1536), nullable=True))
+    op.execute('UPDATE knowledge_base SET embedding_v = embedding::vector WHERE embedding IS NOT NULL')
+    op.drop_column('knowledge_base', 'embedding')
+    op.alter_column('knowledge_base', 'embedding_v', new_column_name='embedding')
+    
+    op.create_index(
+        'ix_knowledge_base_embedding',
+        'knowledge_base',
+        ['embedding'],
+        postgresql_using='hnsw',
+        postgresql_ops={'embedding': 'vector_cosine_ops'}
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_knowledge_base_embedding', table_name='knowledge_base')
+    
+    op.add_column('knowledge_base', sa.Column('embedding_t', sa.Text(), nullable=True))
+    op.execute('UPDATE knowledge_base SET embedding_t = embedding::text WHERE embedding IS NOT NULL')
+    op.drop_column('knowledge_base', 'embedding')
+    op.alter_column('knowledge_base', 'embedding_t', new_column_name='embedding')
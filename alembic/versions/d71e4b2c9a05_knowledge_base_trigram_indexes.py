@@ -0,0 +1,43 @@
+"""Trigram indexes for knowledge base keyword search
+
+Revision ID: d71e4b2c9a05
+Revises: 8c3e5b7a2d14
+Create Date: 2026-10-15 11:26:03.918254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd71e4b2c9a05'
+down_revision: Union[str, None] = '8c3e5b7a2d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    
+    # Serve ILIKE '%query%' from the index instead of a sequential scan
+    op.create_index(
+        'ix_kb_content_trgm',
+        'knowledge_base',
+        ['content'],
+        postgresql_using='gin',
+        postgresql_ops={'content': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_kb_title_trgm',
+        'knowledge_base',
+        ['title'],
+        postgresql_using='gin',
+        postgresql_ops={'title': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_kb_title_trgm', table_name='knowledge_base')
+    op.drop_index('ix_kb_content_trgm', table_name='knowledge_base')
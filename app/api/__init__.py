@@ -1,3 +1,2 @@
-from app.api import website, whatsapp, telegram
-
+# Router modules are imported on demand (main.py skips unconfigured platforms)
 __all__ = ["website", "whatsapp", "telegram"]
\ No newline at end of file
@@ -0,0 +1,59 @@
+import asyncio
+from fastapi import Request
+from typing import List, Optional
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.ai_service import AIService
+from app.services.knowledge_service import KnowledgeService
+from app.services.telegram_service import TelegramService
+from app.services.whatsapp_service import WhatsAppService
+
+# Caps webhook replies being generated in the background; bursts queue here
+# instead of opening unbounded DB sessions and provider requests
+inflight_replies = asyncio.Semaphore(settings.MAX_INFLIGHT)
+
+
+def _get_shared(request: Request, name: str, factory):
+    """
+    Get a shared service from app state
+    Created on first use when the lifespan hasn't run (e.g. TestClient without `with`)
+    """
+    state = request.app.state
+    service = getattr(state, name, None)
+    if service is None:
+        service = factory()
+        setattr(state, name, service)
+    return service
+
+
+def get_ai_service(request: Request) -> AIService:
+    """Shared AI service created at startup"""
+    return _get_shared(request, "ai_service", AIService)
+
+
+def get_telegram_service(request: Request) -> TelegramService:
+    """Shared Telegram service created at startup"""
+    return _get_shared(request, "telegram_service", TelegramService)
+
+
+def get_whatsapp_service(request: Request) -> WhatsAppService:
+    """Shared WhatsApp service created at startup"""
+    return _get_shared(request, "whatsapp_service", WhatsAppService)
+
+
+async def search_knowledge(
+    ai_service: AIService,
+    query: str,
+    embedding: Optional[List[float]] = None
+) -> str:
+    """
+    Knowledge context for a message, in its own short-lived session
+    Safe to run alongside queries on the request's session
+    """
+    async with SessionLocal() as knowledge_db:
+        knowledge_service = KnowledgeService(knowledge_db, ai_service)
+        return await knowledge_service.search_relevant_knowledge(
+            query=query,
+            limit=3,
+            embedding=embedding
+        )
\ No newline at end of file
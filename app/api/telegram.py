@@ -1,113 +1,200 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.services.ai_service import AIService
+import asyncio
+from fastapi import APIRouter, Request, Depends, HTTPException, BackgroundTasks
+from typing import Dict, List, Optional
+from app.core.database import SessionLocal, db_ready
+from app.api.deps import (
+    get_ai_service,
+    get_telegram_service,
+    inflight_replies,
+    search_knowledge
+)
+from app.services.ai_service import AIService, ERROR_RESPONSE
 from app.services.conversation_service import ConversationService
+from app.services.prompts import TELEGRAM_SYSTEM_PROMPT
 from app.services.telegram_service import TelegramService
-from app.services.knowledge_service import KnowledgeService
 from app.utils.logger import logger
+from app.utils.semantic_cache import semantic_cache
 
 router = APIRouter()
 
 
+async def stream_reply(
+    ai_service: AIService,
+    telegram_service: TelegramService,
+    conv_service: ConversationService,
+    chat_id: str,
+    db_user_id: int,
+    user_text: str,
+    history: List[Dict[str, str]],
+    custom_context: Optional[str],
+    query_embedding: Optional[List[float]],
+    use_cache: bool
+):
+    """Generate a reply while streaming it into the chat, then save the conversation"""
+    try:
+        ai_response = await telegram_service.send_streaming_message(
+            chat_id,
+            ai_service.stream_response(
+                user_message=user_text,
+                conversation_history=history,
+                system_prompt=TELEGRAM_SYSTEM_PROMPT,
+                custom_context=custom_context
+            )
+        )
+        
+        if use_cache and ai_response != ERROR_RESPONSE:
+            semantic_cache.store("telegram", user_text, query_embedding, ai_response)
+        
+        await conv_service.save_conversation(
+            user_id=db_user_id,
+            user_message=user_text,
+            ai_response=ai_response,
+            platform="telegram",
+            model_used=ai_service.model
+        )
+        
+    except Exception as e:
+        logger.error("Error streaming Telegram reply: %s", e)
+
+
+async def handle_message(
+    ai_service: AIService,
+    telegram_service: TelegramService,
+    parsed_data: Dict
+):
+    """Answer a Telegram message (runs after the webhook has been acknowledged)"""
+    await db_ready.wait()
+    async with inflight_replies, SessionLocal() as db:
+        try:
+            # Initialize services
+            conv_service = ConversationService(db)
+            
+            chat_id = parsed_data["chat_id"]
+            user_text = parsed_data["text"]
+            
+            # Get user identifier
+            user_identifier = telegram_service.get_user_identifier(
+                parsed_data["user_id"], parsed_data["username"]
+            )
+            
+            # Get or create user
+            returning = conv_service.is_recent_user(user_identifier)
+            db_user_id = await conv_service.get_or_create_user_id(
+                user_identifier=user_identifier,
+                platform="telegram",
+                name=parsed_data["first_name"]
+            )
+            
+            # Get conversation history; recently active users have history and
+            # skip the semantic cache, so their knowledge search runs alongside it
+            custom_context = None
+            if returning:
+                history, custom_context = await asyncio.gather(
+                    conv_service.get_user_history(user_id=db_user_id, limit=10),
+                    search_knowledge(ai_service, user_text)
+                )
+            else:
+                history = await conv_service.get_user_history(
+                    user_id=db_user_id,
+                    limit=10
+                )
+            
+            # End the read transaction so no pooled connection sits
+            # idle in transaction while the AI provider is called
+            await db.commit()
+            
+            # Only first-turn messages use the semantic cache, later replies
+            # depend on the user's own conversation history
+            use_cache = not history
+            ai_response, query_embedding = None, None
+            if use_cache:
+                ai_response, query_embedding = await semantic_cache.lookup(
+                    "telegram", user_text, ai_service.get_embedding
+                )
+            
+            if ai_response is None:
+                # Get relevant knowledge unless it was fetched with the history;
+                # the message is only embedded here if the cache lookup didn't already
+                if custom_context is None:
+                    custom_context = await search_knowledge(
+                        ai_service, user_text, query_embedding
+                    )
+                
+                # Stream the AI response into the chat as it is written
+                await stream_reply(
+                    ai_service=ai_service,
+                    telegram_service=telegram_service,
+                    conv_service=conv_service,
+                    chat_id=chat_id,
+                    db_user_id=db_user_id,
+                    user_text=user_text,
+                    history=history,
+                    custom_context=custom_context if custom_context else None,
+                    query_embedding=query_embedding,
+                    use_cache=use_cache
+                )
+                
+                logger.info("Telegram response streamed to chat_id: %s", chat_id)
+                return
+            
+            # Send cached response back to Telegram and save conversation
+            await telegram_service.send_message(chat_id, ai_response)
+            await conv_service.save_conversation(
+                user_id=db_user_id,
+                user_message=user_text,
+                ai_response=ai_response,
+                platform="telegram",
+                model_used=ai_service.model
+            )
+            
+        except Exception as e:
+            logger.error("Error handling Telegram message: %s", e)
+
+
 @router.post("/webhook")
 async def telegram_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    ai_service: AIService = Depends(get_ai_service),
+    telegram_service: TelegramService = Depends(get_telegram_service)
 ):
     """
     Telegram webhook endpoint for receiving messages
     
-    Telegram sends data as JSON
+    Telegram sends data as JSON. The update is acknowledged right away and
+    answered in the background, so slow AI providers don't trigger redelivery
     """
     try:
         # Get JSON data
         data = await request.json()
-        logger.info(f"Received Telegram webhook: {data}")
+        logger.debug("Received Telegram webhook: %s", data)
         
-        # Check if it's a message update
-        if "message" not in data:
+        # Only text messages are answered (edits, callbacks, media etc. are skipped)
+        message = data.get("message")
+        if not message or not message.get("text"):
             return {"ok": True}
         
-        # Initialize services
-        ai_service = AIService()
-        conv_service = ConversationService(db)
-        telegram_service = TelegramService()
-        knowledge_service = KnowledgeService(db)
-        
-        # Parse webhook data
+        # Parse webhook data and answer after the response is sent
         parsed_data = telegram_service.parse_webhook_data(data)
-        
-        chat_id = parsed_data["chat_id"]
-        user_text = parsed_data["text"]
-        username = parsed_data["username"]
-        user_id = parsed_data["user_id"]
-        
-        # Handle empty message
-        if not user_text:
-            return {"ok": True}
-        
-        # Get user identifier
-        user_identifier = telegram_service.get_user_identifier(user_id, username)
-        
-        # Get or create user
-        user = conv_service.get_or_create_user(
-            user_identifier=user_identifier,
-            platform="telegram",
-            name=parsed_data["first_name"]
-        )
-        
-        # Get conversation history
-        history = conv_service.get_user_history(
-            user_identifier=user_identifier,
-            limit=10
-        )
-        
-        # Search for relevant knowledge
-        custom_context = await knowledge_service.search_relevant_knowledge(
-            query=user_text,
-            limit=3
-        )
-        
-        # Generate AI response
-        ai_response = await ai_service.generate_response(
-            user_message=user_text,
-            conversation_history=history,
-            system_prompt="You are a helpful Telegram bot assistant. Be friendly and use emojis when appropriate.",
-            custom_context=custom_context if custom_context else None
-        )
-        
-        # Save conversation
-        conv_service.save_conversation(
-            user_id=user.id,
-            user_message=user_text,
-            ai_response=ai_response,
-            platform="telegram",
-            model_used=ai_service.model
-        )
-        
-        # Send response back to Telegram
-        await telegram_service.send_message(chat_id, ai_response)
-        
-        logger.info(f"Telegram response sent to chat_id: {chat_id}")
+        background_tasks.add_task(handle_message, ai_service, telegram_service, parsed_data)
         
         return {"ok": True}
         
     except Exception as e:
-        logger.error(f"Error in Telegram webhook: {e}")
+        logger.error("Error in Telegram webhook: %s", e)
         return {"ok": False, "error": str(e)}
 
 
 @router.get("/setup")
-async def setup_telegram_webhook():
+async def setup_telegram_webhook(
+    telegram_service: TelegramService = Depends(get_telegram_service)
+):
     """
     Setup Telegram webhook (one-time setup)
     
     Call this endpoint once to register your webhook URL with Telegram
     """
     try:
-        telegram_service = TelegramService()
-        
         success = await telegram_service.set_webhook()
         
         if success:
@@ -123,7 +210,7 @@ async def setup_telegram_webhook():
             )
             
     except Exception as e:
-        logger.error(f"Error setting up Telegram webhook: {e}")
+        logger.error("Error setting up Telegram webhook: %s", e)
         raise HTTPException(
             status_code=500,
             detail=str(e)
@@ -131,13 +218,13 @@ async def setup_telegram_webhook():
 
 
 @router.get("/webhook-info")
-async def get_webhook_info():
+async def get_webhook_info(
+    telegram_service: TelegramService = Depends(get_telegram_service)
+):
     """
     Get current Telegram webhook information
     """
     try:
-        telegram_service = TelegramService()
-        
         info = await telegram_service.get_webhook_info()
         
         return {
@@ -146,7 +233,7 @@ async def get_webhook_info():
         }
         
     except Exception as e:
-        logger.error(f"Error getting webhook info: {e}")
+        logger.error("Error getting webhook info: %s", e)
         raise HTTPException(
             status_code=500,
             detail=str(e)
@@ -154,13 +241,13 @@ async def get_webhook_info():
 
 
 @router.delete("/webhook")
-async def delete_telegram_webhook():
+async def delete_telegram_webhook(
+    telegram_service: TelegramService = Depends(get_telegram_service)
+):
     """
     Delete Telegram webhook
     """
     try:
-        telegram_service = TelegramService()
-        
         success = await telegram_service.delete_webhook()
         
         if success:
@@ -175,7 +262,7 @@ async def delete_telegram_webhook():
             )
             
     except Exception as e:
-        logger.error(f"Error deleting webhook: {e}")
+        logger.error("Error deleting webhook: %s", e)
         raise HTTPException(
             status_code=500,
             detail=str(e)
@@ -185,7 +272,8 @@ async def delete_telegram_webhook():
 @router.post("/send-test")
 async def send_test_telegram_message(
     chat_id: str,
-    message: str = "Hello! This is a test message from your AI chatbot."
+    message: str = "Hello! This is a test message from your AI chatbot.",
+    telegram_service: TelegramService = Depends(get_telegram_service)
 ):
     """
     Send a test Telegram message
@@ -194,8 +282,6 @@ async def send_test_telegram_message(
     - **message**: Test message to send
     """
     try:
-        telegram_service = TelegramService()
-        
         success = await telegram_service.send_message(chat_id, message)
         
         if success:
@@ -210,7 +296,7 @@ async def send_test_telegram_message(
             }
             
     except Exception as e:
-        logger.error(f"Error sending test message: {e}")
+        logger.error("Error sending test message: %s", e)
         return {
             "success": False,
             "message": str(e)
@@ -218,13 +304,13 @@ async def send_test_telegram_message(
 
 
 @router.get("/status")
-async def telegram_status():
+async def telegram_status(
+    telegram_service: TelegramService = Depends(get_telegram_service)
+):
     """
     Check Telegram integration status
     """
     try:
-        telegram_service = TelegramService()
-        
         if telegram_service.bot_token:
             webhook_info = await telegram_service.get_webhook_info()
             
@@ -241,7 +327,7 @@ async def telegram_status():
             }
             
     except Exception as e:
-        logger.error(f"Error checking Telegram status: {e}")
+        logger.error("Error checking Telegram status: %s", e)
         return {
             "status": "error",
             "message": str(e)
@@ -1,27 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import asyncio
+import orjson
+from app.core.database import get_db, SessionLocal
+from app.api.deps import get_ai_service, search_knowledge
 from app.schemas.chat import (
     ChatRequest,
     ChatResponse,
-    ConversationHistoryResponse,
-    ConversationHistoryItem
+    ConversationHistoryResponse
 )
-from app.services.ai_service import AIService
+from app.services.ai_service import AIService, ERROR_RESPONSE
 from app.services.conversation_service import ConversationService
-from app.services.knowledge_service import KnowledgeService
+from app.services.prompts import WEBSITE_SYSTEM_PROMPT
 from app.utils.helpers import generate_session_id
 from app.utils.logger import logger
+from app.utils.semantic_cache import semantic_cache
 from datetime import datetime
 
 router = APIRouter()
 
 
+async def prepare_reply(
+    message: str,
+    use_cache: bool,
+    ai_service: AIService,
+    custom_context: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str], Optional[List[float]]]:
+    """
+    Look up a cached reply, or the knowledge context for generating one
+    
+    Args:
+        custom_context: Knowledge context already fetched alongside the history
+    
+    Returns:
+        (cached response or None, knowledge context or None, message embedding)
+    """
+    ai_response, query_embedding = None, None
+    if use_cache:
+        ai_response, query_embedding = await semantic_cache.lookup(
+            "website", message, ai_service.get_embedding
+        )
+    if ai_response is not None:
+        return ai_response, None, query_embedding
+    
+    # Get relevant knowledge unless it was fetched with the history;
+    # the message is only embedded here if the cache lookup didn't already
+    if custom_context is None:
+        custom_context = await search_knowledge(ai_service, message, query_embedding)
+    
+    return None, custom_context or None, query_embedding
+
+
 @router.post("/send", response_model=ChatResponse)
 async def send_message(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """
     Handle website chat messages
@@ -35,47 +72,64 @@ async def send_message(
         session_id = request.session_id or generate_session_id()
         
         # Initialize services
-        ai_service = AIService()
         conv_service = ConversationService(db)
-        knowledge_service = KnowledgeService(db)
         
         # Get or create user
-        user = conv_service.get_or_create_user(
+        returning = conv_service.is_recent_user(session_id)
+        user_id = await conv_service.get_or_create_user_id(
             user_identifier=session_id,
             platform="website",
             name=request.user_name
         )
         
-        # Get conversation history
-        history = conv_service.get_user_history(
-            user_identifier=session_id,
-            limit=10
-        )
+        # Get conversation history; recently active users have history and
+        # skip the semantic cache, so their knowledge search runs alongside it
+        custom_context = None
+        if returning:
+            history, custom_context = await asyncio.gather(
+                conv_service.get_user_history(user_id=user_id, limit=10),
+                search_knowledge(ai_service, request.message)
+            )
+        else:
+            history = await conv_service.get_user_history(
+                user_id=user_id,
+                limit=10
+            )
         
-        # Search for relevant knowledge (RAG)
-        custom_context = await knowledge_service.search_relevant_knowledge(
-            query=request.message,
-            limit=3
-        )
+        # End the read transaction so no pooled connection sits
+        # idle in transaction while the AI provider is called
+        await db.commit()
         
-        # Generate AI response
-        ai_response = await ai_service.generate_response(
-            user_message=request.message,
-            conversation_history=history,
-            system_prompt="You are a helpful AI assistant for a website chatbot. Be friendly and concise.",
-            custom_context=custom_context if custom_context else None
+        # Only first-turn messages use the semantic cache, later replies
+        # depend on the user's own conversation history
+        use_cache = not history
+        ai_response, custom_context, query_embedding = await prepare_reply(
+            request.message, use_cache, ai_service, custom_context
         )
         
-        # Save conversation
-        conv_service.save_conversation(
-            user_id=user.id,
+        if ai_response is None:
+            # Generate AI response
+            ai_response = await ai_service.generate_response(
+                user_message=request.message,
+                conversation_history=history,
+                system_prompt=WEBSITE_SYSTEM_PROMPT,
+                custom_context=custom_context
+            )
+            
+            if use_cache and ai_response != ERROR_RESPONSE:
+                semantic_cache.store("website", request.message, query_embedding, ai_response)
+        
+        # Save conversation after the response is sent
+        background_tasks.add_task(
+            conv_service.save_conversation,
+            user_id=user_id,
             user_message=request.message,
             ai_response=ai_response,
             platform="website",
             model_used=ai_service.model
         )
         
-        logger.info(f"Website chat processed for session: {session_id}")
+        logger.info("Website chat processed for session: %s", session_id)
         
         return ChatResponse(
             message=ai_response,
@@ -84,18 +138,119 @@ async def send_message(
         )
         
     except Exception as e:
-        logger.error(f"Error in send_message: {e}")
+        logger.error("Error in send_message: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process message"
         )
 
 
+@router.post("/stream")
+async def stream_message(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """
+    Handle website chat messages, streaming the reply as Server-Sent Events
+    
+    Each `data:` event carries a `delta` text chunk; a final `done` event
+    carries the `session_id` and `timestamp`
+    """
+    try:
+        # Generate or use provided session_id
+        session_id = request.session_id or generate_session_id()
+        
+        conv_service = ConversationService(db)
+        
+        # Get or create user
+        returning = conv_service.is_recent_user(session_id)
+        user_id = await conv_service.get_or_create_user_id(
+            user_identifier=session_id,
+            platform="website",
+            name=request.user_name
+        )
+        
+        # Get conversation history; recently active users have history and
+        # skip the semantic cache, so their knowledge search runs alongside it
+        custom_context = None
+        if returning:
+            history, custom_context = await asyncio.gather(
+                conv_service.get_user_history(user_id=user_id, limit=10),
+                search_knowledge(ai_service, request.message)
+            )
+        else:
+            history = await conv_service.get_user_history(
+                user_id=user_id,
+                limit=10
+            )
+        
+        # End the read transaction before streaming starts
+        await db.commit()
+        
+        use_cache = not history
+        cached_response, custom_context, query_embedding = await prepare_reply(
+            request.message, use_cache, ai_service, custom_context
+        )
+        
+    except Exception as e:
+        logger.error("Error in stream_message: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process message"
+        )
+    
+    async def events():
+        parts = []
+        if cached_response is not None:
+            parts.append(cached_response)
+            yield b"data: " + orjson.dumps({"delta": cached_response}) + b"\n\n"
+        else:
+            async for chunk in ai_service.stream_response(
+                user_message=request.message,
+                conversation_history=history,
+                system_prompt=WEBSITE_SYSTEM_PROMPT,
+                custom_context=custom_context
+            ):
+                parts.append(chunk)
+                yield b"data: " + orjson.dumps({"delta": chunk}) + b"\n\n"
+        
+        yield b"event: done\ndata: " + orjson.dumps({
+            "session_id": session_id,
+            "timestamp": datetime.utcnow()
+        }) + b"\n\n"
+        
+        ai_response = "".join(parts)
+        if cached_response is None and use_cache and ai_response != ERROR_RESPONSE:
+            semantic_cache.store("website", request.message, query_embedding, ai_response)
+        
+        # The request session is closed by now, save with a new one
+        async with SessionLocal() as save_db:
+            try:
+                await ConversationService(save_db).save_conversation(
+                    user_id=user_id,
+                    user_message=request.message,
+                    ai_response=ai_response,
+                    platform="website",
+                    model_used=ai_service.model
+                )
+            except Exception as e:
+                logger.error("Error saving streamed conversation: %s", e)
+        
+        logger.info("Website chat streamed for session: %s", session_id)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/history/{session_id}", response_model=ConversationHistoryResponse)
 async def get_chat_history(
     session_id: str,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get chat history for a session
@@ -107,39 +262,30 @@ async def get_chat_history(
         conv_service = ConversationService(db)
         
         # Get conversations
-        conversations = conv_service.get_conversation_by_session(
+        conversations = await conv_service.get_conversation_by_session(
             session_id=session_id,
             limit=limit
         )
         
-        # Convert to response format
-        history_items = []
-        for conv in conversations:
-            # Add user message
-            history_items.append(
-                ConversationHistoryItem(
-                    role="user",
-                    content=conv.user_message,
-                    timestamp=conv.timestamp
-                )
-            )
-            # Add AI response
-            history_items.append(
-                ConversationHistoryItem(
-                    role="assistant",
-                    content=conv.ai_response,
-                    timestamp=conv.timestamp
-                )
+        # Build the response directly (rows come from the DB already typed,
+        # so pydantic validation and encoding are skipped)
+        history_items = [
+            item
+            for conv in conversations
+            for item in (
+                {"role": "user", "content": conv.user_message, "timestamp": conv.timestamp},
+                {"role": "assistant", "content": conv.ai_response, "timestamp": conv.timestamp}
             )
+        ]
         
-        return ConversationHistoryResponse(
-            session_id=session_id,
-            conversations=history_items,
-            total=len(history_items)
-        )
+        return ORJSONResponse({
+            "session_id": session_id,
+            "conversations": history_items,
+            "total": len(history_items)
+        })
         
     except Exception as e:
-        logger.error(f"Error getting chat history: {e}")
+        logger.error("Error getting chat history: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get chat history"
@@ -149,7 +295,7 @@ async def get_chat_history(
 @router.delete("/history/{session_id}")
 async def delete_chat_history(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete chat history for a session
@@ -159,7 +305,7 @@ async def delete_chat_history(
     try:
         conv_service = ConversationService(db)
         
-        success = conv_service.delete_user_history(
+        success = await conv_service.delete_user_history(
             user_identifier=session_id
         )
         
@@ -174,7 +320,7 @@ async def delete_chat_history(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting chat history: {e}")
+        logger.error("Error deleting chat history: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete chat history"
@@ -184,7 +330,7 @@ async def delete_chat_history(
 @router.get("/stats/{session_id}")
 async def get_session_stats(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get statistics for a session
@@ -194,7 +340,7 @@ async def get_session_stats(
     try:
         conv_service = ConversationService(db)
         
-        stats = conv_service.get_user_stats(
+        stats = await conv_service.get_user_stats(
             user_identifier=session_id
         )
         
@@ -209,7 +355,7 @@ async def get_session_stats(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting session stats: {e}")
+        logger.error("Error getting session stats: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get session stats"
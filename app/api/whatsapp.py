@@ -1,110 +1,159 @@
-from fastapi import APIRouter, Form, Depends, Response
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.services.ai_service import AIService
+import asyncio
+from fastapi import APIRouter, Form, Depends, Response, BackgroundTasks
+from app.core.database import SessionLocal, db_ready
+from app.api.deps import (
+    get_ai_service,
+    get_whatsapp_service,
+    inflight_replies,
+    search_knowledge
+)
+from app.services.ai_service import AIService, ERROR_RESPONSE
 from app.services.conversation_service import ConversationService
-from app.services.whatsapp_service import WhatsAppService
-from app.services.knowledge_service import KnowledgeService
+from app.services.prompts import WHATSAPP_SYSTEM_PROMPT
+from app.services.whatsapp_service import (
+    WhatsAppService,
+    ERROR_MESSAGE,
+    TWIML_EMPTY,
+    TWIML_ERROR
+)
 from app.utils.logger import logger
 from app.utils.helpers import clean_phone_number
+from app.utils.semantic_cache import semantic_cache
 
 router = APIRouter()
 
 
+async def handle_message(
+    ai_service: AIService,
+    whatsapp_service: WhatsAppService,
+    from_number: str,
+    body: str
+):
+    """Answer a WhatsApp message (runs after the webhook has been acknowledged)"""
+    await db_ready.wait()
+    async with inflight_replies, SessionLocal() as db:
+        try:
+            # Initialize services
+            conv_service = ConversationService(db)
+            
+            # Clean phone number
+            user_phone = clean_phone_number(from_number)
+            
+            # Get or create user
+            returning = conv_service.is_recent_user(user_phone)
+            user_id = await conv_service.get_or_create_user_id(
+                user_identifier=user_phone,
+                platform="whatsapp"
+            )
+            
+            # Get conversation history; recently active users have history and
+            # skip the semantic cache, so their knowledge search runs alongside it
+            custom_context = None
+            if returning:
+                history, custom_context = await asyncio.gather(
+                    conv_service.get_user_history(user_id=user_id, limit=10),
+                    search_knowledge(ai_service, body)
+                )
+            else:
+                history = await conv_service.get_user_history(
+                    user_id=user_id,
+                    limit=10
+                )
+            
+            # End the read transaction so no pooled connection sits
+            # idle in transaction while the AI provider is called
+            await db.commit()
+            
+            # Only first-turn messages use the semantic cache, later replies
+            # depend on the user's own conversation history
+            use_cache = not history
+            ai_response, query_embedding = None, None
+            if use_cache:
+                ai_response, query_embedding = await semantic_cache.lookup(
+                    "whatsapp", body, ai_service.get_embedding
+                )
+            
+            if ai_response is None:
+                # Get relevant knowledge unless it was fetched with the history;
+                # the message is only embedded here if the cache lookup didn't already
+                if custom_context is None:
+                    custom_context = await search_knowledge(
+                        ai_service, body, query_embedding
+                    )
+                
+                # Generate AI response
+                ai_response = await ai_service.generate_response(
+                    user_message=body,
+                    conversation_history=history,
+                    system_prompt=WHATSAPP_SYSTEM_PROMPT,
+                    custom_context=custom_context if custom_context else None
+                )
+                
+                if use_cache and ai_response != ERROR_RESPONSE:
+                    semantic_cache.store("whatsapp", body, query_embedding, ai_response)
+            
+            # Send the reply, then save the conversation
+            await whatsapp_service.send_message(from_number, ai_response)
+            await conv_service.save_conversation(
+                user_id=user_id,
+                user_message=body,
+                ai_response=ai_response,
+                platform="whatsapp",
+                model_used=ai_service.model
+            )
+            
+        except Exception as e:
+            logger.error("Error handling WhatsApp message: %s", e)
+            
+            # Return error message to user
+            await whatsapp_service.send_message(from_number, ERROR_MESSAGE)
+
+
 @router.post("/webhook")
 async def whatsapp_webhook(
+    background_tasks: BackgroundTasks,
     Body: str = Form(...),
     From: str = Form(...),
     To: str = Form(None),
     MessageSid: str = Form(None),
     AccountSid: str = Form(None),
-    db: Session = Depends(get_db)
+    ai_service: AIService = Depends(get_ai_service),
+    whatsapp_service: WhatsAppService = Depends(get_whatsapp_service)
 ):
     """
     WhatsApp webhook endpoint for receiving messages from Twilio
     
-    Twilio sends data as form-encoded, not JSON
+    Twilio sends data as form-encoded, not JSON. The message is acknowledged
+    with an empty TwiML response and answered in the background via the REST API
     """
     try:
-        logger.info(f"Received WhatsApp message from {From}: {Body}")
-        
-        # Initialize services
-        ai_service = AIService()
-        conv_service = ConversationService(db)
-        whatsapp_service = WhatsAppService()
-        knowledge_service = KnowledgeService(db)
-        
-        # Clean phone number
-        user_phone = clean_phone_number(From)
-        
-        # Get or create user
-        user = conv_service.get_or_create_user(
-            user_identifier=user_phone,
-            platform="whatsapp"
-        )
-        
-        # Get conversation history
-        history = conv_service.get_user_history(
-            user_identifier=user_phone,
-            limit=10
-        )
-        
-        # Search for relevant knowledge
-        custom_context = await knowledge_service.search_relevant_knowledge(
-            query=Body,
-            limit=3
-        )
-        
-        # Generate AI response
-        ai_response = await ai_service.generate_response(
-            user_message=Body,
-            conversation_history=history,
-            system_prompt="You are a helpful WhatsApp assistant. Keep responses concise and friendly.",
-            custom_context=custom_context if custom_context else None
-        )
+        logger.info("Received WhatsApp message from %s: %s", From, Body)
         
-        # Save conversation
-        conv_service.save_conversation(
-            user_id=user.id,
-            user_message=Body,
-            ai_response=ai_response,
-            platform="whatsapp",
-            model_used=ai_service.model
-        )
-        
-        # Create TwiML response
-        twiml_response = whatsapp_service.create_response(ai_response)
-        
-        logger.info(f"WhatsApp response sent to {From}")
+        background_tasks.add_task(handle_message, ai_service, whatsapp_service, From, Body)
         
         return Response(
-            content=twiml_response,
+            content=TWIML_EMPTY,
             media_type="application/xml"
         )
         
     except Exception as e:
-        logger.error(f"Error in WhatsApp webhook: {e}")
+        logger.error("Error in WhatsApp webhook: %s", e)
         
         # Return error message to user
-        whatsapp_service = WhatsAppService()
-        error_response = whatsapp_service.create_response(
-            "Sorry, I encountered an error. Please try again later."
-        )
-        
         return Response(
-            content=error_response,
+            content=TWIML_ERROR,
             media_type="application/xml"
         )
 
 
 @router.get("/status")
-async def whatsapp_status():
+async def whatsapp_status(
+    whatsapp_service: WhatsAppService = Depends(get_whatsapp_service)
+):
     """
     Check WhatsApp integration status
     """
     try:
-        whatsapp_service = WhatsAppService()
-        
         if whatsapp_service.client:
             return {
                 "status": "active",
@@ -118,7 +167,7 @@ async def whatsapp_status():
             }
             
     except Exception as e:
-        logger.error(f"Error checking WhatsApp status: {e}")
+        logger.error("Error checking WhatsApp status: %s", e)
         return {
             "status": "error",
             "message": str(e)
@@ -128,7 +177,8 @@ async def whatsapp_status():
 @router.post("/send-test")
 async def send_test_message(
     to_number: str,
-    message: str = "Hello! This is a test message from your AI chatbot."
+    message: str = "Hello! This is a test message from your AI chatbot.",
+    whatsapp_service: WhatsAppService = Depends(get_whatsapp_service)
 ):
     """
     Send a test WhatsApp message
@@ -137,13 +187,11 @@ async def send_test_message(
     - **message**: Test message to send
     """
     try:
-        whatsapp_service = WhatsAppService()
-        
         # Add whatsapp: prefix if not present
         if not to_number.startswith("whatsapp:"):
             to_number = f"whatsapp:{to_number}"
         
-        success = whatsapp_service.send_message(to_number, message)
+        success = await whatsapp_service.send_message(to_number, message)
         
         if success:
             return {
@@ -157,7 +205,7 @@ async def send_test_message(
             }
             
     except Exception as e:
-        logger.error(f"Error sending test message: {e}")
+        logger.error("Error sending test message: %s", e)
         return {
             "success": False,
             "message": str(e)
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
-from typing import List
-from functools import lru_cache
+from typing import List, Tuple
+from functools import lru_cache, cached_property
 
 
 class Settings(BaseSettings):
@@ -16,6 +16,7 @@ class Settings(BaseSettings):
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 50  # per worker process
     
     # WhatsApp (Twilio)
     TWILIO_ACCOUNT_SID: str = ""
@@ -30,24 +31,56 @@ class Settings(BaseSettings):
     DEBUG: bool = True
     SECRET_KEY: str
     ALLOWED_ORIGINS: str = "*"
+    WEB_CONCURRENCY: int = 0  # worker processes when not reloading (0 = one per CPU)
     
     # AI Settings
     AI_PROVIDER: str = "gemini"  # gemini, openai, groq
     AI_MODEL: str = "gemini-pro"
+    AI_FALLBACK_PROVIDERS: str = ""  # provider:model list, e.g. "groq:mixtral-8x7b-32768,openai:gpt-3.5-turbo"
+    AI_FAILOVER_THRESHOLD: int = 3  # consecutive failures before a provider is skipped
+    AI_FAILOVER_MAX_COOLDOWN: float = 60.0  # seconds
+    GEMINI_RPM: int = 60  # outbound requests per minute per provider and worker (0 = unlimited)
+    OPENAI_RPM: int = 500
+    GROQ_RPM: int = 30
     MAX_CONVERSATION_HISTORY: int = 10
     TEMPERATURE: float = 0.7
     MAX_TOKENS: int = 1000
+    KNOWLEDGE_MIN_SIMILARITY: float = 0.8  # vector knowledge search cutoff
+    LLM_TIMEOUT: float = 15.0  # seconds per provider request attempt
+    LLM_MAX_RETRIES: int = 2
+    LLM_DEADLINE: float = 30.0  # seconds for the whole generation, retries included
+    EMBED_TIMEOUT: float = 10.0  # seconds per embedding request attempt
+    EMBED_CONCURRENCY: int = 8  # parallel embedding requests for bulk imports
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 20
+    MAX_INFLIGHT: int = 100  # webhook replies generated concurrently, the rest wait
     
-    @property
+    # Semantic Response Cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_TTL: int = 3600  # seconds
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000  # per platform
+    SEMANTIC_CACHE_ANN_MIN_ENTRIES: int = 2000  # HNSW index from this size, at most MAX_ENTRIES (needs faiss-cpu)
+    SEMANTIC_CACHE_PATH: str = ""  # persist across restarts (empty = disabled)
+    
+    @cached_property
     def allowed_origins_list(self) -> List[str]:
-        """Convert ALLOWED_ORIGINS string to list"""
+        """Convert ALLOWED_ORIGINS string to list (computed once)"""
         if self.ALLOWED_ORIGINS == "*":
             return ["*"]
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
     
+    @cached_property
+    def ai_provider_chain(self) -> List[Tuple[str, str]]:
+        """(provider, model) pairs in failover order, AI_PROVIDER first"""
+        chain = [(self.AI_PROVIDER, self.AI_MODEL)]
+        for entry in self.AI_FALLBACK_PROVIDERS.split(","):
+            if entry.strip():
+                provider, _, model = entry.strip().partition(":")
+                chain.append((provider.strip(), model.strip()))
+        return chain
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
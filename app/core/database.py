@@ -1,37 +1,70 @@
-from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator
 from app.core.config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
+
+def get_async_database_url(url: str) -> str:
+    """Use the asyncio driver for plain PostgreSQL URLs"""
+    database_url = make_url(url)
+    if database_url.drivername in ("postgresql", "postgresql+psycopg2", "postgres"):
+        database_url = database_url.set(drivername="postgresql+asyncpg")
+    return database_url.render_as_string(hide_password=False)
+
+
+# Create async database engine
+engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL),
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=20,
+    max_overflow=10,
+    pool_recycle=1800,
+    query_cache_size=1200
 )
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # Base class for models
 Base = declarative_base()
 
+# Cleared while init_db runs in the background at startup; set otherwise
+db_ready = asyncio.Event()
+db_ready.set()
 
-def get_db() -> Generator[Session, None, None]:
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Database dependency for FastAPI routes
-    Usage: db: Session = Depends(get_db)
+    Usage: db: AsyncSession = Depends(get_db)
     """
+    await db_ready.wait()
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
-def init_db():
+async def init_db():
     """Initialize database tables"""
     from app.models import user, conversation, knowledge_base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    async with engine.begin() as conn:
+        # Vector type for knowledge base embeddings, trigram ops for keyword search
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def close_db():
+    """Dispose database connection pool"""
+    await engine.dispose()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from app.middleware.rate_limiter import RateLimiter
 from app.middleware.error_handler import setup_exception_handlers
+from app.middleware.health import HealthCheck
 
-__all__ = ["RateLimiter", "setup_exception_handlers"]
\ No newline at end of file
+__all__ = ["RateLimiter", "setup_exception_handlers", "HealthCheck"]
\ No newline at end of file
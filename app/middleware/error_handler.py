@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.utils.logger import logger
@@ -13,7 +14,7 @@ def setup_exception_handlers(app: FastAPI):
         """Handle HTTP exceptions"""
         logger.error(f"HTTP error: {exc.status_code} - {exc.detail}")
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=exc.status_code,
             content={
                 "error": exc.detail,
@@ -26,11 +27,11 @@ def setup_exception_handlers(app: FastAPI):
         """Handle validation errors"""
         logger.error(f"Validation error: {exc.errors()}")
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             content={
                 "error": "Validation error",
-                "details": exc.errors()
+                "details": jsonable_encoder(exc.errors())
             }
         )
     
@@ -39,7 +40,7 @@ def setup_exception_handlers(app: FastAPI):
         """Handle all other exceptions"""
         logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
                 "error": "Internal server error",
@@ -0,0 +1,21 @@
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class HealthCheck:
+    """
+    Pure ASGI middleware answering GET /health with a fixed body
+    Added outermost, so probes skip CORS, rate limiting and routing
+    """
+    
+    def __init__(self, app: ASGIApp, body: bytes, path: str = "/health"):
+        self.app = app
+        self.path = path
+        self.response = Response(body, media_type="application/json")
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"] == self.path and scope["method"] == "GET":
+            await self.response(scope, receive, send)
+            return
+        
+        await self.app(scope, receive, send)
\ No newline at end of file
@@ -1,24 +1,74 @@
 from fastapi import Request, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Dict
-from datetime import datetime, timedelta
-from collections import defaultdict
+from typing import Deque, Dict, Tuple
+from collections import defaultdict, deque
+import time
+import redis.asyncio as aioredis
 from app.core.config import settings
+from app.utils.cache import redis_pool
 from app.utils.logger import logger
 
 
 class RateLimiter(BaseHTTPMiddleware):
     """
-    Simple in-memory rate limiter middleware
-    For production, use Redis-based rate limiting
+    Redis-based fixed-window rate limiter middleware
+    Counts are shared across all workers; falls back to
+    in-memory counting while Redis is unavailable
     """
     
     def __init__(self, app, calls: int = None, period: int = 60):
         super().__init__(app)
         self.calls = calls or settings.RATE_LIMIT_PER_MINUTE
         self.period = period  # seconds
-        self.clients: Dict[str, list] = defaultdict(list)
+        self.clients: Dict[str, Deque[float]] = defaultdict(deque)
+        self.redis_retry_at = 0.0
+        
+        # Connections come from the pool shared with the cache
+        self.redis_client = aioredis.Redis(connection_pool=redis_pool)
+    
+    async def _hit_redis(self, client_ip: str) -> Tuple[int, int]:
+        """
+        Count request in the current Redis window
+        
+        Returns:
+            (requests in window, window reset timestamp)
+        """
+        # Wall clock, so all workers agree on the window
+        window = int(time.time()) // self.period
+        key = f"rl:{client_ip}:{window}"
+        
+        # MULTI/EXEC so the counter never exists without its TTL
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, self.period, nx=True)
+            count, _ = await pipe.execute()
+        
+        return count, (window + 1) * self.period
+    
+    def _hit_memory(self, client_ip: str) -> Tuple[int, int]:
+        """
+        Count request in the in-memory sliding window
+        
+        Returns:
+            (requests in window, window reset timestamp)
+        """
+        now = time.monotonic()
+        timestamps = self.clients[client_ip]
+        
+        # Clean old timestamps (oldest first)
+        cutoff = now - self.period
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
+        
+        # Rejected requests are not recorded
+        if len(timestamps) < self.calls:
+            timestamps.append(now)
+            count = len(timestamps)
+        else:
+            count = len(timestamps) + 1
+        
+        return count, int(time.time()) + self.period
     
     async def dispatch(self, request: Request, call_next):
         # Get client identifier (IP address)
@@ -28,20 +78,21 @@ class RateLimiter(BaseHTTPMiddleware):
         if request.url.path == "/health":
             return await call_next(request)
         
-        # Get current timestamp
-        now = datetime.utcnow()
-        
-        # Clean old timestamps
-        cutoff = now - timedelta(seconds=self.period)
-        self.clients[client_ip] = [
-            timestamp for timestamp in self.clients[client_ip]
-            if timestamp > cutoff
-        ]
+        # Count request (Redis first, in-memory while Redis is down)
+        if self.redis_client and time.monotonic() >= self.redis_retry_at:
+            try:
+                count, reset = await self._hit_redis(client_ip)
+            except Exception as e:
+                logger.warning("Redis rate limiter error: %s. Using in-memory rate limiting.", e)
+                self.redis_retry_at = time.monotonic() + self.period
+                count, reset = self._hit_memory(client_ip)
+        else:
+            count, reset = self._hit_memory(client_ip)
         
         # Check rate limit
-        if len(self.clients[client_ip]) >= self.calls:
-            logger.warning(f"Rate limit exceeded for {client_ip}")
-            return JSONResponse(
+        if count > self.calls:
+            logger.warning("Rate limit exceeded for %s", client_ip)
+            return ORJSONResponse(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 content={
                     "detail": "Rate limit exceeded. Please try again later.",
@@ -49,16 +100,13 @@ class RateLimiter(BaseHTTPMiddleware):
                 }
             )
         
-        # Add current request timestamp
-        self.clients[client_ip].append(now)
-        
         # Process request
         response = await call_next(request)
         
         # Add rate limit headers
-        remaining = self.calls - len(self.clients[client_ip])
+        remaining = self.calls - count
         response.headers["X-RateLimit-Limit"] = str(self.calls)
         response.headers["X-RateLimit-Remaining"] = str(max(0, remaining))
-        response.headers["X-RateLimit-Reset"] = str(int((now + timedelta(seconds=self.period)).timestamp()))
+        response.headers["X-RateLimit-Reset"] = str(reset)
         
         return response
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -13,7 +13,7 @@ class Conversation(Base):
     user_message = Column(Text, nullable=False)
     ai_response = Column(Text, nullable=False)
     platform = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
     
     # Metadata
     tokens_used = Column(Integer, nullable=True)
@@ -22,5 +22,14 @@ class Conversation(Base):
     # Relationships
     user = relationship("User", back_populates="conversations")
     
+    # Serves the per-user "latest N messages" lookup as a single index range scan
+    __table_args__ = (
+        Index("ix_conv_user_ts", user_id, timestamp.desc()),
+    )
+    
+    # Server-generated values come back with the INSERT/UPDATE (RETURNING),
+    # so rows don't need a refresh after commit
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<Conversation {self.id} for User {self.user_id}>"
\ No newline at end of file
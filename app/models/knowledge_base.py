@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from pgvector.sqlalchemy import Vector
 from datetime import datetime
 from app.core.database import Base
 
+# text-embedding-ada-002
+EMBEDDING_DIMENSIONS = 1536
+
 
 class KnowledgeBase(Base):
     """Knowledge base for RAG"""
@@ -11,9 +15,37 @@ class KnowledgeBase(Base):
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     category = Column(String, nullable=True, index=True)
-    embedding = Column(Text, nullable=True)  # JSON string of embedding vector
+    embedding = Column(Vector(EMBEDDING_DIMENSIONS), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Approximate nearest-neighbour index for cosine distance search
+    __table_args__ = (
+        Index(
+            "ix_knowledge_base_embedding",
+            embedding,
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ),
+        
+        # Trigram indexes for the ILIKE keyword search (needs pg_trgm)
+        Index(
+            "ix_kb_content_trgm",
+            content,
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_kb_title_trgm",
+            title,
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"}
+        ),
+    )
+    
+    # Server-generated values come back with the INSERT/UPDATE (RETURNING),
+    # so rows don't need a refresh after commit
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<KnowledgeBase {self.title}>"
\ No newline at end of file
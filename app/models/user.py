@@ -26,5 +26,9 @@ class User(Base):
     # Relationships
     conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
     
+    # Server-generated values come back with the INSERT/UPDATE (RETURNING),
+    # so rows don't need a refresh after commit
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<User {self.user_identifier} ({self.platform})>"
\ No newline at end of file
@@ -1,37 +1,150 @@
+import asyncio
+import hashlib
+import orjson
+import time
+import httpx
+import groq
+import openai
 import google.generativeai as genai
-from openai import OpenAI
-from groq import Groq
-from typing import List, Dict, Optional
+from google.api_core import exceptions as google_exceptions
+from openai import AsyncOpenAI
+from groq import AsyncGroq
+from typing import AsyncIterator, List, Dict, Optional
 from app.core.config import settings
 from app.utils.logger import logger
 from app.utils.cache import cache_manager
+from app.utils.helpers import ai_response_key
+from app.utils.ratelimit import TokenBucket
+from app.services.prompts import DEFAULT_SYSTEM_PROMPT
+
+# Returned to the user when generation fails (never cached)
+ERROR_RESPONSE = "Sorry, I encountered an error. Please try again."
+
+# System message used when no custom prompt is given (shared, never mutated)
+DEFAULT_SYSTEM_MESSAGE = {"role": "system", "content": DEFAULT_SYSTEM_PROMPT}
+
+# Per-attempt limits for the provider SDKs (they retry on a fresh connection)
+LLM_HTTP_TIMEOUT = httpx.Timeout(settings.LLM_TIMEOUT, connect=3.0)
+
+# Errors worth retrying on the next provider in the chain
+FAILOVER_ERRORS = (
+    asyncio.TimeoutError,
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    groq.RateLimitError,
+    groq.APIConnectionError,
+    groq.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+
+class _Provider:
+    """A configured AI provider with its rate limiter and circuit breaker state"""
+    
+    __slots__ = ("name", "model", "client", "limiter", "failures", "open_until")
+    
+    def __init__(self, name: str, model: str, client):
+        self.name = name
+        self.model = model
+        self.client = client
+        
+        # Outbound request budget: fill at RPM/60 per second, burst of RPM/10
+        rpm = getattr(settings, f"{name.upper()}_RPM")
+        self.limiter = TokenBucket(rpm / 60, rpm / 10) if rpm > 0 else None
+        
+        # Consecutive failures, skipped until open_until once over the threshold
+        self.failures = 0
+        self.open_until = 0.0
+    
+    def record_failure(self):
+        """Count a failure and open the breaker (1s, 2s, 4s, ... cooldown)"""
+        self.failures += 1
+        if self.failures >= settings.AI_FAILOVER_THRESHOLD:
+            cooldown = min(
+                2.0 ** (self.failures - settings.AI_FAILOVER_THRESHOLD),
+                settings.AI_FAILOVER_MAX_COOLDOWN
+            )
+            self.open_until = time.monotonic() + cooldown
+    
+    def record_success(self):
+        """Close the breaker"""
+        self.failures = 0
+        self.open_until = 0.0
 
 
 class AIService:
     """AI service for handling different AI providers"""
     
+    # Fixed attribute layout, no per-instance __dict__
+    __slots__ = (
+        "temperature",
+        "max_tokens",
+        "providers",
+        "provider",
+        "model",
+        "client",
+        "embed_client",
+    )
+    
     def __init__(self):
-        self.provider = settings.AI_PROVIDER
-        self.model = settings.AI_MODEL
         self.temperature = settings.TEMPERATURE
         self.max_tokens = settings.MAX_TOKENS
         
-        # Initialize based on provider
-        if self.provider == "gemini":
+        # Providers in failover order, the configured AI_PROVIDER first
+        self.providers = [
+            self._build_provider(name, model)
+            for name, model in settings.ai_provider_chain
+        ]
+        self.provider = self.providers[0].name
+        self.model = self.providers[0].model
+        self.client = self.providers[0].client
+        
+        # Embedding client, reused across requests. Kept separate from the chat
+        # client so embeddings get their own shorter timeout and connection pool
+        self.embed_client = None
+        if settings.OPENAI_API_KEY:
+            self.embed_client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                timeout=httpx.Timeout(settings.EMBED_TIMEOUT, connect=3.0),
+                max_retries=settings.LLM_MAX_RETRIES
+            )
+    
+    @staticmethod
+    def _build_provider(name: str, model: str) -> _Provider:
+        """Create the client for a provider"""
+        if not model:
+            logger.error(f"No model configured for AI provider: {name}")
+            raise ValueError(f"No model configured for AI provider: {name}")
+        
+        if name == "gemini":
             genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.client = genai.GenerativeModel(self.model)
+            client = genai.GenerativeModel(model)
             logger.info("Gemini AI initialized")
             
-        elif self.provider == "openai":
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        elif name == "openai":
+            client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                timeout=LLM_HTTP_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES
+            )
             logger.info("OpenAI initialized")
             
-        elif self.provider == "groq":
-            self.client = Groq(api_key=settings.GROQ_API_KEY)
+        elif name == "groq":
+            client = AsyncGroq(
+                api_key=settings.GROQ_API_KEY,
+                timeout=LLM_HTTP_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES
+            )
             logger.info("Groq AI initialized")
         else:
-            logger.error(f"Unknown AI provider: {self.provider}")
-            raise ValueError(f"Unknown AI provider: {self.provider}")
+            logger.error(f"Unknown AI provider: {name}")
+            raise ValueError(f"Unknown AI provider: {name}")
+        
+        return _Provider(name, model, client)
     
     async def generate_response(
         self,
@@ -41,7 +154,7 @@ class AIService:
         custom_context: Optional[str] = None
     ) -> str:
         """
-        Generate AI response based on provider
+        Generate AI response, failing over to the next provider on transient errors
         
         Args:
             user_message: Current user message
@@ -54,39 +167,247 @@ class AIService:
         """
         try:
             # Check cache first
-            cache_key = f"ai_response:{hash(user_message)}"
-            cached_response = cache_manager.get(cache_key)
+            cache_key = self._cache_key(
+                user_message, conversation_history, system_prompt, custom_context
+            )
+            cached_response = await cache_manager.get(cache_key)
             if cached_response:
                 logger.info("Returning cached response")
                 return cached_response
             
-            # Generate response based on provider
-            if self.provider == "gemini":
-                response = await self._generate_gemini(
-                    user_message, conversation_history, system_prompt, custom_context
-                )
-            elif self.provider == "openai":
-                response = await self._generate_openai(
-                    user_message, conversation_history, system_prompt, custom_context
-                )
-            elif self.provider == "groq":
-                response = await self._generate_groq(
-                    user_message, conversation_history, system_prompt, custom_context
-                )
-            else:
-                response = "Sorry, AI service is not available."
+            response = await self._generate_with_failover(
+                user_message, conversation_history, system_prompt, custom_context
+            )
             
             # Cache response for 1 hour
-            cache_manager.set(cache_key, response, expire=3600)
+            cache_manager.set_nowait(cache_key, response, expire=3600)
+            
+            return response
+            
+        except Exception as e:
+            logger.error(f"AI generation error: {e!r}")
+            return ERROR_RESPONSE
+    
+    async def _generate_with_failover(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        custom_context: Optional[str]
+    ) -> str:
+        """Try providers in order, skipping those whose breaker is open"""
+        providers = self._available_providers()
+        for index, provider in enumerate(providers):
+            generate = getattr(self, f"_generate_{provider.name}")
+            try:
+                # Hard deadline, Gemini's SDK has no request timeout of its own
+                response = await asyncio.wait_for(
+                    self._rate_limited(
+                        provider, generate,
+                        user_message, conversation_history, system_prompt, custom_context
+                    ),
+                    timeout=settings.LLM_DEADLINE
+                )
+            except FAILOVER_ERRORS as e:
+                provider.record_failure()
+                if index + 1 == len(providers):
+                    raise
+                logger.warning(
+                    "AI failover %s -> %s: %r", provider.name, providers[index + 1].name, e
+                )
+                continue
             
+            provider.record_success()
             return response
+    
+    def _available_providers(self) -> List[_Provider]:
+        """Providers to try in order, skipping those whose breaker is open"""
+        now = time.monotonic()
+        providers = [p for p in self.providers if p.open_until <= now]
+        
+        # Every breaker is open, try them all rather than fail outright
+        return providers or self.providers
+    
+    async def stream_response(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        system_prompt: Optional[str] = None,
+        custom_context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream AI response text as it is generated
+        Fails over to the next provider only until the first chunk arrives
+        
+        Args:
+            user_message: Current user message
+            conversation_history: List of previous messages
+            system_prompt: Custom system prompt
+            custom_context: Additional context (for RAG)
+        
+        Yields:
+            Response text chunks (ERROR_RESPONSE if nothing could be generated)
+        """
+        cache_key = self._cache_key(
+            user_message, conversation_history, system_prompt, custom_context
+        )
+        cached_response = await cache_manager.get(cache_key)
+        if cached_response:
+            logger.info("Returning cached response")
+            yield cached_response
+            return
+        
+        parts = []
+        try:
+            providers = self._available_providers()
+            for index, provider in enumerate(providers):
+                stream = getattr(self, f"_stream_{provider.name}")(
+                    provider, user_message, conversation_history, system_prompt, custom_context
+                )
+                try:
+                    # Wait for the first chunk, the provider can still be switched until then
+                    try:
+                        if provider.limiter:
+                            await asyncio.wait_for(
+                                provider.limiter.acquire(), timeout=settings.LLM_DEADLINE
+                            )
+                        chunk = await asyncio.wait_for(
+                            stream.__anext__(), timeout=settings.LLM_DEADLINE
+                        )
+                    except StopAsyncIteration:
+                        provider.record_success()
+                        break
+                    except FAILOVER_ERRORS as e:
+                        provider.record_failure()
+                        if index + 1 == len(providers):
+                            raise
+                        logger.warning(
+                            "AI failover %s -> %s: %r", provider.name, providers[index + 1].name, e
+                        )
+                        continue
+                    
+                    provider.record_success()
+                    
+                    # Each following chunk must arrive within the per-request timeout
+                    # (lookups hoisted out of the per-chunk loop)
+                    append, next_chunk, timeout = parts.append, stream.__anext__, settings.LLM_TIMEOUT
+                    while True:
+                        append(chunk)
+                        yield chunk
+                        try:
+                            chunk = await asyncio.wait_for(next_chunk(), timeout=timeout)
+                        except StopAsyncIteration:
+                            break
+                    break
+                finally:
+                    await stream.aclose()
             
         except Exception as e:
-            logger.error(f"AI generation error: {e}")
-            return "Sorry, I encountered an error. Please try again."
+            logger.error(f"AI streaming error: {e!r}")
+            if not parts:
+                yield ERROR_RESPONSE
+            return
+        
+        if not parts:
+            logger.error("AI streaming error: empty response")
+            yield ERROR_RESPONSE
+            return
+        
+        # Cache the complete response for 1 hour
+        cache_manager.set_nowait(cache_key, "".join(parts), expire=3600)
+    
+    async def _stream_openai(
+        self,
+        provider: _Provider,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        custom_context: Optional[str]
+    ) -> AsyncIterator[str]:
+        """Stream response using OpenAI (Groq uses the same API)"""
+        stream = await provider.client.chat.completions.create(
+            model=provider.model,
+            messages=self._build_messages(
+                user_message, conversation_history, system_prompt, custom_context
+            ),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                yield content
+    
+    _stream_groq = _stream_openai
+    
+    async def _stream_gemini(
+        self,
+        provider: _Provider,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        custom_context: Optional[str]
+    ) -> AsyncIterator[str]:
+        """Stream response using Gemini"""
+        response = await provider.client.generate_content_async(
+            self._build_prompt(
+                user_message, conversation_history, system_prompt, custom_context
+            ),
+            generation_config=genai.types.GenerationConfig(
+                temperature=self.temperature,
+                max_output_tokens=self.max_tokens,
+            ),
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+    
+    @staticmethod
+    async def _rate_limited(provider: _Provider, generate, *args) -> str:
+        """Call a provider once its rate limiter allows it"""
+        if provider.limiter is None:
+            return await generate(provider, *args)
+        
+        await provider.limiter.acquire()
+        try:
+            return await generate(provider, *args)
+        except (openai.APIConnectionError, groq.APIConnectionError) as e:
+            # Never reached the provider, so it doesn't count against the budget
+            if not isinstance(e, (openai.APITimeoutError, groq.APITimeoutError)):
+                provider.limiter.release()
+            raise
+    
+    def _cache_key(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        custom_context: Optional[str]
+    ) -> str:
+        """
+        Build a stable response cache key
+        Covers everything the reply depends on, so it's shared across workers
+        and restarts and never mixes up different conversations
+        """
+        payload = orjson.dumps(
+            {
+                "p": self.provider,
+                "m": self.model,
+                "t": self.temperature,
+                "sys": system_prompt or DEFAULT_SYSTEM_PROMPT,
+                "ctx": custom_context,
+                "hist": (conversation_history or [])[-settings.MAX_CONVERSATION_HISTORY:],
+                "u": user_message
+            },
+            option=orjson.OPT_SORT_KEYS
+        )
+        return ai_response_key(hashlib.blake2b(payload, digest_size=16).hexdigest())
     
     async def _generate_gemini(
         self,
+        provider: _Provider,
         user_message: str,
         conversation_history: List[Dict[str, str]],
         system_prompt: Optional[str],
@@ -100,7 +421,7 @@ class AIService:
             )
             
             # Generate response
-            response = self.client.generate_content(
+            response = await provider.client.generate_content_async(
                 prompt,
                 generation_config=genai.types.GenerationConfig(
                     temperature=self.temperature,
@@ -116,6 +437,7 @@ class AIService:
     
     async def _generate_openai(
         self,
+        provider: _Provider,
         user_message: str,
         conversation_history: List[Dict[str, str]],
         system_prompt: Optional[str],
@@ -123,36 +445,13 @@ class AIService:
     ) -> str:
         """Generate response using OpenAI"""
         try:
-            # Build messages
-            messages = []
-            
-            # Add system prompt
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            else:
-                messages.append({
-                    "role": "system",
-                    "content": "You are a helpful AI assistant."
-                })
-            
-            # Add custom context if provided
-            if custom_context:
-                messages.append({
-                    "role": "system",
-                    "content": f"Context: {custom_context}"
-                })
-            
-            # Add conversation history
-            if conversation_history:
-                for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY:]:
-                    messages.append(msg)
-            
-            # Add current message
-            messages.append({"role": "user", "content": user_message})
+            messages = self._build_messages(
+                user_message, conversation_history, system_prompt, custom_context
+            )
             
             # Generate response
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = await provider.client.chat.completions.create(
+                model=provider.model,
                 messages=messages,
                 temperature=self.temperature,
                 max_tokens=self.max_tokens
@@ -166,6 +465,7 @@ class AIService:
     
     async def _generate_groq(
         self,
+        provider: _Provider,
         user_message: str,
         conversation_history: List[Dict[str, str]],
         system_prompt: Optional[str],
@@ -173,32 +473,14 @@ class AIService:
     ) -> str:
         """Generate response using Groq"""
         try:
-            # Build messages (same as OpenAI format)
-            messages = []
-            
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            else:
-                messages.append({
-                    "role": "system",
-                    "content": "You are a helpful AI assistant."
-                })
-            
-            if custom_context:
-                messages.append({
-                    "role": "system",
-                    "content": f"Context: {custom_context}"
-                })
-            
-            if conversation_history:
-                for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY:]:
-                    messages.append(msg)
-            
-            messages.append({"role": "user", "content": user_message})
+            # Same message format as OpenAI
+            messages = self._build_messages(
+                user_message, conversation_history, system_prompt, custom_context
+            )
             
             # Generate response
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = await provider.client.chat.completions.create(
+                model=provider.model,
                 messages=messages,
                 temperature=self.temperature,
                 max_tokens=self.max_tokens
@@ -210,6 +492,24 @@ class AIService:
             logger.error(f"Groq generation error: {e}")
             raise
     
+    def _build_messages(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        custom_context: Optional[str]
+    ) -> List[Dict[str, str]]:
+        """Build chat messages for OpenAI-compatible APIs (OpenAI, Groq)"""
+        history = conversation_history[-settings.MAX_CONVERSATION_HISTORY:] if conversation_history else ()
+        
+        # Built as a single list (system prompt, context, history, current message)
+        return [
+            {"role": "system", "content": system_prompt} if system_prompt else DEFAULT_SYSTEM_MESSAGE,
+            *([{"role": "system", "content": f"Context: {custom_context}"}] if custom_context else ()),
+            *history,
+            {"role": "user", "content": user_message}
+        ]
+    
     def _build_prompt(
         self,
         user_message: str,
@@ -218,30 +518,20 @@ class AIService:
         custom_context: Optional[str]
     ) -> str:
         """Build complete prompt for Gemini"""
-        parts = []
-        
-        # Add system prompt
-        if system_prompt:
-            parts.append(f"System: {system_prompt}\n")
-        else:
-            parts.append("System: You are a helpful AI assistant.\n")
-        
-        # Add custom context
-        if custom_context:
-            parts.append(f"\nContext: {custom_context}\n")
+        context_block = f"\nContext: {custom_context}\n" if custom_context else ""
         
-        # Add conversation history
+        history_block = ""
         if conversation_history:
-            parts.append("\nConversation History:\n")
-            for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY:]:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                parts.append(f"{role}: {msg['content']}\n")
-        
-        # Add current message
-        parts.append(f"\nUser: {user_message}\n")
-        parts.append("Assistant:")
+            history_block = "\nConversation History:\n" + "".join(
+                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}\n"
+                for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY:]
+            )
         
-        return "".join(parts)
+        return (
+            f"System: {system_prompt or DEFAULT_SYSTEM_PROMPT}\n"
+            f"{context_block}{history_block}"
+            f"\nUser: {user_message}\nAssistant:"
+        )
     
     async def get_embedding(self, text: str) -> List[float]:
         """
@@ -249,9 +539,8 @@ class AIService:
         Currently supports OpenAI embeddings
         """
         try:
-            if self.provider == "openai" or settings.OPENAI_API_KEY:
-                client = OpenAI(api_key=settings.OPENAI_API_KEY)
-                response = client.embeddings.create(
+            if self.embed_client:
+                response = await self.embed_client.embeddings.create(
                     model="text-embedding-ada-002",
                     input=text
                 )
@@ -262,4 +551,37 @@ class AIService:
                 
         except Exception as e:
             logger.error(f"Embedding generation error: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embeddings for many texts in one request
+        
+        Args:
+            texts: Texts to embed (at most 2048, the API limit)
+        
+        Returns:
+            One embedding per text, empty lists if embedding failed
+        """
+        try:
+            if not self.embed_client:
+                logger.warning("Embeddings not supported for this provider")
+                return [[] for _ in texts]
+            
+            response = await self.embed_client.embeddings.create(
+                model="text-embedding-ada-002",
+                input=texts[:2048]
+            )
+            return [data.embedding for data in sorted(response.data, key=lambda d: d.index)]
+                
+        except Exception as e:
+            logger.error(f"Batch embedding generation error: {e}")
+            return [[] for _ in texts]
+    
+    async def close(self):
+        """Close the provider clients' connection pools"""
+        clients = [p.client for p in self.providers if p.name in ("openai", "groq")]
+        if self.embed_client:
+            clients.append(self.embed_client)
+        for client in clients:
+            await client.close()
\ No newline at end of file
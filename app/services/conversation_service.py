@@ -1,60 +1,137 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, delete, func, bindparam, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Optional
 from datetime import datetime
+from cachetools import TTLCache
 from app.models.user import User, PlatformType
 from app.models.conversation import Conversation
 from app.utils.logger import logger
 from app.utils.helpers import generate_session_id
 
+# Hot-path statements built once at import so their compiled form is
+# reused from SQLAlchemy's statement cache on every request
+_USER_BY_IDENTIFIER = select(User).where(
+    User.user_identifier == bindparam("user_identifier")
+)
+
+# Latest N pairs via the (user_id, timestamp DESC) index, returned oldest first
+_LATEST_CONVERSATIONS = select(
+    Conversation.user_message,
+    Conversation.ai_response,
+    Conversation.timestamp
+).where(
+    Conversation.user_id == bindparam("user_id")
+).order_by(
+    Conversation.timestamp.desc()
+).limit(bindparam("limit", type_=Integer)).subquery()
+
+_RECENT_CONVERSATIONS = select(
+    _LATEST_CONVERSATIONS.c.user_message,
+    _LATEST_CONVERSATIONS.c.ai_response
+).order_by(
+    _LATEST_CONVERSATIONS.c.timestamp.asc()
+)
+
+# Only the columns the history endpoint renders, joined on the session's user
+_SESSION_CONVERSATIONS = select(
+    Conversation.user_message,
+    Conversation.ai_response,
+    Conversation.timestamp
+).join(
+    User, User.id == Conversation.user_id
+).where(
+    User.user_identifier == bindparam("user_identifier")
+).order_by(
+    Conversation.timestamp.asc()
+).limit(bindparam("limit", type_=Integer))
+
+# User row with its conversation count (served by the user_id-leading index)
+_USER_WITH_COUNT = select(User, func.count(Conversation.id)).outerjoin(
+    Conversation, Conversation.user_id == User.id
+).group_by(User.id)
+
+_USER_STATS = _USER_WITH_COUNT.where(
+    User.user_identifier == bindparam("user_identifier")
+)
+
+_USER_STATS_BULK = _USER_WITH_COUNT.where(
+    User.id.in_(bindparam("user_ids", expanding=True))
+)
+
+# user_identifier -> User.id for recently active users (ids never change)
+_user_id_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
 
 class ConversationService:
     """Service for managing conversations"""
     
-    def __init__(self, db: Session):
+    __slots__ = ("db",)
+    
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def get_or_create_user(
+    async def get_or_create_user(
         self,
         user_identifier: str,
         platform: str,
         name: Optional[str] = None
     ) -> User:
-        """Get existing user or create new one"""
+        """Get existing user or create new one (single upsert round trip)"""
         try:
-            # Try to find existing user
-            user = self.db.query(User).filter(
-                User.user_identifier == user_identifier
-            ).first()
-            
-            if user:
-                # Update last active
-                user.last_active = datetime.utcnow()
-                if name and not user.name:
-                    user.name = name
-                self.db.commit()
-                self.db.refresh(user)
-                logger.info(f"Found existing user: {user_identifier}")
-                return user
-            
-            # Create new user
-            platform_enum = PlatformType(platform)
-            new_user = User(
+            now = datetime.utcnow()
+            stmt = insert(User).values(
                 user_identifier=user_identifier,
-                platform=platform_enum,
-                name=name
+                platform=PlatformType(platform),
+                name=name,
+                last_active=now
+            )
+            
+            # Existing user: update last active, keep the stored name if any
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.user_identifier],
+                set_={
+                    "last_active": now,
+                    "name": func.coalesce(User.name, stmt.excluded.name)
+                }
+            ).returning(User)
+            
+            result = await self.db.execute(
+                stmt, execution_options={"populate_existing": True}
             )
-            self.db.add(new_user)
-            self.db.commit()
-            self.db.refresh(new_user)
-            logger.info(f"Created new user: {user_identifier}")
-            return new_user
+            user = result.scalar_one()
+            await self.db.commit()
+            logger.info(f"Upserted user: {user_identifier}")
+            return user
             
         except Exception as e:
             logger.error(f"Error in get_or_create_user: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
-    def save_conversation(
+    async def get_or_create_user_id(
+        self,
+        user_identifier: str,
+        platform: str,
+        name: Optional[str] = None
+    ) -> int:
+        """
+        Get user ID, creating the user if needed
+        Recently seen users are served from memory without a query
+        """
+        user_id = _user_id_cache.get(user_identifier)
+        if user_id is None:
+            user = await self.get_or_create_user(user_identifier, platform, name)
+            user_id = _user_id_cache[user_identifier] = user.id
+        return user_id
+    
+    @staticmethod
+    def is_recent_user(user_identifier: str) -> bool:
+        """Whether the user was active in the last few minutes (user id cached)"""
+        return user_identifier in _user_id_cache
+    
+    async def save_conversation(
         self,
         user_id: int,
         user_message: str,
@@ -72,19 +149,24 @@ class ConversationService:
                 model_used=model_used
             )
             self.db.add(conversation)
-            self.db.commit()
-            self.db.refresh(conversation)
+            
+            # Update last active (skipped by get_or_create_user_id for cached users)
+            await self.db.execute(
+                update(User).where(User.id == user_id).values(last_active=datetime.utcnow())
+            )
+            
+            await self.db.commit()
             logger.info(f"Saved conversation for user {user_id}")
             return conversation
             
         except Exception as e:
             logger.error(f"Error saving conversation: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
-    def get_user_history(
+    async def get_user_history(
         self,
-        user_identifier: str,
+        user_id: int,
         limit: int = 10
     ) -> List[Dict[str, str]]:
         """
@@ -92,112 +174,109 @@ class ConversationService:
         Returns in format: [{"role": "user", "content": "..."}, ...]
         """
         try:
-            # Find user
-            user = self.db.query(User).filter(
-                User.user_identifier == user_identifier
-            ).first()
+            # Get message pairs in chronological order (plain rows, no ORM objects)
+            result = await self.db.execute(
+                _RECENT_CONVERSATIONS, {"user_id": user_id, "limit": limit}
+            )
             
-            if not user:
-                return []
-            
-            # Get conversations
-            conversations = self.db.query(Conversation).filter(
-                Conversation.user_id == user.id
-            ).order_by(
-                Conversation.timestamp.desc()
-            ).limit(limit).all()
-            
-            # Convert to chat format (reverse to chronological order)
-            history = []
-            for conv in reversed(conversations):
-                history.append({
-                    "role": "user",
-                    "content": conv.user_message
-                })
-                history.append({
-                    "role": "assistant",
-                    "content": conv.ai_response
-                })
-            
-            return history
+            # Convert to chat format
+            return [
+                message
+                for user_message, ai_response in result
+                for message in (
+                    {"role": "user", "content": user_message},
+                    {"role": "assistant", "content": ai_response}
+                )
+            ]
             
         except Exception as e:
             logger.error(f"Error getting user history: {e}")
             return []
     
-    def get_conversation_by_session(
+    async def get_conversation_by_session(
         self,
         session_id: str,
         limit: int = 50
-    ) -> List[Conversation]:
-        """Get conversations by session ID (for website)"""
+    ) -> List[Row]:
+        """
+        Get conversations by session ID (for website)
+        Returns (user_message, ai_response, timestamp) rows, oldest first
+        """
         try:
-            user = self.db.query(User).filter(
-                User.user_identifier == session_id
-            ).first()
-            
-            if not user:
-                return []
-            
-            conversations = self.db.query(Conversation).filter(
-                Conversation.user_id == user.id
-            ).order_by(
-                Conversation.timestamp.asc()
-            ).limit(limit).all()
-            
-            return conversations
+            result = await self.db.execute(
+                _SESSION_CONVERSATIONS, {"user_identifier": session_id, "limit": limit}
+            )
+            return list(result.all())
             
         except Exception as e:
             logger.error(f"Error getting conversations by session: {e}")
             return []
     
-    def delete_user_history(self, user_identifier: str) -> bool:
+    async def delete_user_history(self, user_identifier: str) -> bool:
         """Delete all user's conversation history"""
         try:
-            user = self.db.query(User).filter(
-                User.user_identifier == user_identifier
-            ).first()
+            result = await self.db.execute(
+                _USER_BY_IDENTIFIER, {"user_identifier": user_identifier}
+            )
+            user = result.scalar_one_or_none()
             
             if not user:
                 return False
             
             # Delete all conversations
-            self.db.query(Conversation).filter(
-                Conversation.user_id == user.id
-            ).delete()
+            await self.db.execute(
+                delete(Conversation).where(Conversation.user_id == user.id)
+            )
             
-            self.db.commit()
+            await self.db.commit()
             logger.info(f"Deleted history for user: {user_identifier}")
             return True
             
         except Exception as e:
             logger.error(f"Error deleting user history: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return False
     
-    def get_user_stats(self, user_identifier: str) -> Dict:
+    async def get_user_stats(self, user_identifier: str) -> Dict:
         """Get user statistics"""
         try:
-            user = self.db.query(User).filter(
-                User.user_identifier == user_identifier
-            ).first()
+            result = await self.db.execute(
+                _USER_STATS, {"user_identifier": user_identifier}
+            )
+            row = result.first()
             
-            if not user:
+            if not row:
                 return {}
             
-            total_conversations = self.db.query(Conversation).filter(
-                Conversation.user_id == user.id
-            ).count()
-            
-            return {
-                "user_id": user.id,
-                "user_identifier": user.user_identifier,
-                "platform": user.platform.value,
-                "total_conversations": total_conversations,
-                "created_at": user.created_at,
-                "last_active": user.last_active
-            }
+            return self._build_stats(*row)
             
         except Exception as e:
             logger.error(f"Error getting user stats: {e}")
-            return {}
\ No newline at end of file
+            return {}
+    
+    async def get_user_stats_bulk(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Get statistics for many users in one query (keyed by user ID)"""
+        if not user_ids:
+            return {}
+        
+        try:
+            result = await self.db.execute(
+                _USER_STATS_BULK, {"user_ids": list(user_ids)}
+            )
+            return {user.id: self._build_stats(user, total) for user, total in result}
+            
+        except Exception as e:
+            logger.error(f"Error getting user stats in bulk: {e}")
+            return {}
+    
+    @staticmethod
+    def _build_stats(user: User, total_conversations: int) -> Dict:
+        """Statistics dict for a user"""
+        return {
+            "user_id": user.id,
+            "user_identifier": user.user_identifier,
+            "platform": user.platform.value,
+            "total_conversations": total_conversations,
+            "created_at": user.created_at,
+            "last_active": user.last_active
+        }
\ No newline at end of file
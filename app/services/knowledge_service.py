@@ -1,17 +1,31 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import json
+import asyncio
+import hashlib
+from sqlalchemy import select, func, or_
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from app.core.config import settings
 from app.models.knowledge_base import KnowledgeBase
 from app.services.ai_service import AIService
+from app.utils.cache import cache_manager
 from app.utils.logger import logger
 
+# Texts per embeddings request in bulk imports
+EMBED_BATCH_SIZE = 96
+
+# Cached search results (bumping the version makes them all stale)
+KNOWLEDGE_CACHE_TTL = 300
+KNOWLEDGE_VERSION_KEY = "kb:version"
+
 
 class KnowledgeService:
     """Service for managing knowledge base (RAG)"""
     
-    def __init__(self, db: Session):
+    __slots__ = ("db", "ai_service")
+    
+    def __init__(self, db: AsyncSession, ai_service: Optional[AIService] = None):
         self.db = db
-        self.ai_service = AIService()
+        self.ai_service = ai_service or AIService()
     
     async def add_knowledge(
         self,
@@ -33,42 +47,105 @@ class KnowledgeService:
         try:
             # Generate embedding
             embedding = await self.ai_service.get_embedding(content)
-            embedding_json = json.dumps(embedding) if embedding else None
             
             # Create knowledge entry
             knowledge = KnowledgeBase(
                 title=title,
                 content=content,
                 category=category,
-                embedding=embedding_json
+                embedding=embedding or None
             )
             
             self.db.add(knowledge)
-            self.db.commit()
-            self.db.refresh(knowledge)
+            await self.db.commit()
             
+            await self._invalidate_cache()
             logger.info(f"Added knowledge: {title}")
             return knowledge
             
         except Exception as e:
             logger.error(f"Error adding knowledge: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
-    def get_all_knowledge(
+    async def add_knowledge_bulk(self, items: List[Dict]) -> List[KnowledgeBase]:
+        """
+        Add many knowledge entries at once
+        Embeddings are requested concurrently and all rows are saved in one commit
+        
+        Args:
+            items: Dicts with title, content and optional category
+        
+        Returns:
+            Created KnowledgeBase objects
+        """
+        try:
+            contents = [item["content"] for item in items]
+            
+            # Bounded fan-out so a large import doesn't trip provider rate limits
+            semaphore = asyncio.Semaphore(settings.EMBED_CONCURRENCY)
+            
+            async def embed(batch: List[str]) -> List[List[float]]:
+                async with semaphore:
+                    return await self.ai_service.get_embeddings(batch)
+            
+            # One embeddings request per batch instead of one per entry
+            batches = [
+                contents[start:start + EMBED_BATCH_SIZE]
+                for start in range(0, len(contents), EMBED_BATCH_SIZE)
+            ]
+            results = await asyncio.gather(
+                *(embed(batch) for batch in batches), return_exceptions=True
+            )
+            
+            embeddings = []
+            for batch, result in zip(batches, results):
+                if isinstance(result, BaseException) or len(result) != len(batch):
+                    result = [[]] * len(batch)
+                embeddings.extend(result)
+            
+            # Entries whose embedding failed are stored without one
+            knowledge_entries = [
+                KnowledgeBase(
+                    title=item["title"],
+                    content=item["content"],
+                    category=item.get("category"),
+                    embedding=embedding or None
+                )
+                for item, embedding in zip(items, embeddings)
+            ]
+            
+            self.db.add_all(knowledge_entries)
+            await self.db.commit()
+            
+            await self._invalidate_cache()
+            logger.info(f"Added {len(knowledge_entries)} knowledge entries")
+            return knowledge_entries
+            
+        except Exception as e:
+            logger.error(f"Error adding knowledge in bulk: {e}")
+            await self.db.rollback()
+            raise
+    
+    async def get_all_knowledge(
         self,
         category: Optional[str] = None,
         limit: int = 100
     ) -> List[KnowledgeBase]:
-        """Get all knowledge entries"""
+        """
+        Get all knowledge entries
+        The embedding column is not loaded (listings never use it)
+        """
         try:
-            query = self.db.query(KnowledgeBase)
+            query = select(KnowledgeBase).options(
+                defer(KnowledgeBase.embedding, raiseload=True)
+            )
             
             if category:
-                query = query.filter(KnowledgeBase.category == category)
+                query = query.where(KnowledgeBase.category == category)
             
-            knowledge = query.limit(limit).all()
-            return knowledge
+            result = await self.db.execute(query.limit(limit))
+            return list(result.scalars().all())
             
         except Exception as e:
             logger.error(f"Error getting knowledge: {e}")
@@ -77,60 +154,162 @@ class KnowledgeService:
     async def search_relevant_knowledge(
         self,
         query: str,
-        limit: int = 3
+        limit: int = 3,
+        embedding: Optional[List[float]] = None
     ) -> str:
         """
         Search for relevant knowledge based on query
-        Uses simple keyword matching (can be improved with vector search)
+        Uses vector similarity, keyword matching when embeddings aren't available.
+        Results are cached until the knowledge base changes (or 5 minutes pass)
         
         Args:
             query: Search query
             limit: Number of results
+            embedding: Already computed query embedding ([] if embedding failed)
         
         Returns:
             Concatenated relevant content
         """
+        # Entries are tagged with the knowledge version they were built from;
+        # the current version and the entry come back in one round trip
+        cache_key = self._cache_key(query, limit)
+        version, cached = await cache_manager.mget([KNOWLEDGE_VERSION_KEY, cache_key])
+        version = version or 0
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
         try:
-            # Simple keyword search (for production, use vector similarity)
-            knowledge_entries = self.db.query(KnowledgeBase).filter(
-                KnowledgeBase.content.ilike(f"%{query}%")
-            ).limit(limit).all()
-            
-            if not knowledge_entries:
-                return ""
+            if embedding is None:
+                embedding = await self.ai_service.get_embedding(query)
             
-            # Concatenate relevant content
-            context_parts = []
-            for entry in knowledge_entries:
-                context_parts.append(f"Title: {entry.title}\n{entry.content}")
+            if embedding:
+                context = await self._search_by_vector(embedding, limit)
+            else:
+                context = await self._search_by_keyword(query, limit)
             
-            return "\n\n".join(context_parts)
+        except Exception as e:
+            logger.error(f"Error searching knowledge: {e}")
+            return ""
+        
+        # Keyword results stand in for a failed embedding, so they're
+        # only cached when embeddings aren't available at all
+        if embedding or self.ai_service.embed_client is None:
+            cache_manager.set_nowait(cache_key, [version, context], expire=KNOWLEDGE_CACHE_TTL)
+        
+        return context
+    
+    async def search_relevant_knowledge_by_keyword(
+        self,
+        query: str,
+        limit: int = 3
+    ) -> str:
+        """
+        Search for relevant knowledge by keyword matching
+        
+        Args:
+            query: Search query
+            limit: Number of results
+        
+        Returns:
+            Concatenated relevant content
+        """
+        try:
+            return await self._search_by_keyword(query, limit)
             
         except Exception as e:
             logger.error(f"Error searching knowledge: {e}")
             return ""
     
-    def delete_knowledge(self, knowledge_id: int) -> bool:
+    async def search_relevant_knowledge_by_vector(
+        self,
+        embedding: List[float],
+        limit: int = 3
+    ) -> str:
+        """
+        Search for relevant knowledge by cosine similarity (pgvector)
+        Takes an already computed query embedding, so the query isn't embedded again
+        
+        Args:
+            embedding: Embedding of the search query
+            limit: Number of results
+        
+        Returns:
+            Concatenated relevant content
+        """
+        try:
+            return await self._search_by_vector(embedding, limit)
+            
+        except Exception as e:
+            logger.error(f"Error searching knowledge by vector: {e}")
+            return ""
+    
+    async def _search_by_keyword(self, query: str, limit: int) -> str:
+        """Keyword search, best trigram matches first (raises on database errors)"""
+        # Substring filters are served by the pg_trgm GIN indexes
+        similarity = func.greatest(
+            func.similarity(KnowledgeBase.title, query),
+            func.similarity(KnowledgeBase.content, query)
+        )
+        result = await self.db.execute(
+            select(KnowledgeBase.title, KnowledgeBase.content).where(
+                or_(
+                    KnowledgeBase.title.icontains(query, autoescape=True),
+                    KnowledgeBase.content.icontains(query, autoescape=True)
+                )
+            ).order_by(similarity.desc()).limit(limit)
+        )
+        return self._build_context(result.all())
+    
+    async def _search_by_vector(self, embedding: List[float], limit: int) -> str:
+        """Vector search (raises on database errors)"""
+        # Cosine distance computed by pgvector (served by the HNSW index)
+        distance = KnowledgeBase.embedding.cosine_distance(embedding)
+        result = await self.db.execute(
+            select(KnowledgeBase.title, KnowledgeBase.content).where(
+                distance <= 1 - settings.KNOWLEDGE_MIN_SIMILARITY
+            ).order_by(distance).limit(limit)
+        )
+        return self._build_context(result.all())
+    
+    @staticmethod
+    def _cache_key(query: str, limit: int) -> str:
+        """Search cache key for a normalized query"""
+        normalized = " ".join(query.lower().split())
+        digest = hashlib.blake2b(f"{normalized}|{limit}".encode(), digest_size=16).hexdigest()
+        return f"kb:{digest}"
+    
+    @staticmethod
+    async def _invalidate_cache():
+        """Invalidate cached search results after a knowledge change"""
+        await cache_manager.incr(KNOWLEDGE_VERSION_KEY)
+    
+    @staticmethod
+    def _build_context(entries) -> str:
+        """Concatenate knowledge entries into a context string"""
+        return "\n\n".join(
+            f"Title: {entry.title}\n{entry.content}" for entry in entries
+        )
+    
+    async def delete_knowledge(self, knowledge_id: int) -> bool:
         """Delete knowledge entry"""
         try:
-            knowledge = self.db.query(KnowledgeBase).filter(
-                KnowledgeBase.id == knowledge_id
-            ).first()
+            knowledge = await self.db.get(KnowledgeBase, knowledge_id)
             
             if not knowledge:
                 return False
             
-            self.db.delete(knowledge)
-            self.db.commit()
+            await self.db.delete(knowledge)
+            await self.db.commit()
+            await self._invalidate_cache()
             logger.info(f"Deleted knowledge: {knowledge_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error deleting knowledge: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return False
     
-    def update_knowledge(
+    async def update_knowledge(
         self,
         knowledge_id: int,
         title: Optional[str] = None,
@@ -139,26 +318,29 @@ class KnowledgeService:
     ) -> Optional[KnowledgeBase]:
         """Update knowledge entry"""
         try:
-            knowledge = self.db.query(KnowledgeBase).filter(
-                KnowledgeBase.id == knowledge_id
-            ).first()
+            knowledge = await self.db.get(KnowledgeBase, knowledge_id)
             
             if not knowledge:
                 return None
             
             if title:
                 knowledge.title = title
-            if content:
+            if content and content != knowledge.content:
                 knowledge.content = content
+                
+                # Re-embed so vector search ranks the entry by its new text
+                # (a failed embedding clears the stale one)
+                embedding = (await self.ai_service.get_embeddings([content]))[0]
+                knowledge.embedding = embedding or None
             if category:
                 knowledge.category = category
             
-            self.db.commit()
-            self.db.refresh(knowledge)
+            await self.db.commit()
+            await self._invalidate_cache()
             logger.info(f"Updated knowledge: {knowledge_id}")
             return knowledge
             
         except Exception as e:
             logger.error(f"Error updating knowledge: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return None
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+System prompts shared by the chat handlers
+Kept constant so every request sends an identical prompt prefix
+"""
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+WEBSITE_SYSTEM_PROMPT = "You are a helpful AI assistant for a website chatbot. Be friendly and concise."
+
+WHATSAPP_SYSTEM_PROMPT = "You are a helpful WhatsApp assistant. Keep responses concise and friendly."
+
+TELEGRAM_SYSTEM_PROMPT = "You are a helpful Telegram bot assistant. Be friendly and use emojis when appropriate."
\ No newline at end of file
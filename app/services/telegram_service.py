@@ -1,8 +1,53 @@
+import time
 import httpx
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from app.core.config import settings
 from app.utils.logger import logger
 
+# Telegram's limit for a single message text (in UTF-16 code units)
+MAX_MESSAGE_LENGTH = 4096
+
+# Minimum seconds between edits of a streamed reply (Telegram rate limits edits)
+STREAM_EDIT_INTERVAL = 1.0
+
+
+def utf16_length(text: str) -> int:
+    """Length of text as Telegram counts it (UTF-16 code units)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Split text into chunks that fit in a Telegram message
+    Chunks end at the last newline (or space) before the limit when there is one
+    
+    Args:
+        text: Message text
+        limit: Maximum chunk length in UTF-16 code units
+    
+    Returns:
+        List of chunks (the text itself if it already fits)
+    """
+    chunks = []
+    while utf16_length(text) > limit:
+        # Characters outside the BMP count twice, shrink until the prefix fits
+        cut = limit
+        while (excess := utf16_length(text[:cut]) - limit) > 0:
+            cut -= (excess + 1) // 2
+        
+        # Prefer a line break, then a word break, in the second half of the chunk
+        for separator in ("\n", " "):
+            index = text.rfind(separator, cut // 2, cut)
+            if index > 0:
+                cut = index + 1
+                break
+        
+        chunks.append(text[:cut])
+        text = text[cut:]
+    
+    chunks.append(text)
+    return chunks
+
 
 class TelegramService:
     """Service for Telegram Bot integration"""
@@ -10,7 +55,15 @@ class TelegramService:
     def __init__(self):
         self.bot_token = settings.TELEGRAM_BOT_TOKEN
         self.webhook_url = settings.TELEGRAM_WEBHOOK_URL
-        self.api_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.api_url = f"/bot{self.bot_token}"
+        
+        # Persistent HTTP/2 client, requests are multiplexed over one TLS session
+        self.client = httpx.AsyncClient(
+            base_url="https://api.telegram.org",
+            http2=True,
+            timeout=httpx.Timeout(5.0, connect=2.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+        )
         
         if self.bot_token:
             logger.info("Telegram bot initialized")
@@ -32,6 +85,17 @@ class TelegramService:
             logger.error("Telegram bot token not configured")
             return False
         
+        # Long replies go out as several messages, in order
+        sent = True
+        for chunk in split_message(text):
+            sent = await self._send_chunk(chat_id, chunk) and sent
+        
+        if sent:
+            logger.info(f"Telegram message sent to {chat_id}")
+        return sent
+    
+    async def _send_chunk(self, chat_id: str, text: str) -> bool:
+        """Send one message with Markdown, resent as plain text if Telegram can't parse it"""
         try:
             url = f"{self.api_url}/sendMessage"
             payload = {
@@ -40,17 +104,114 @@ class TelegramService:
                 "parse_mode": "Markdown"
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-            
-            logger.info(f"Telegram message sent to {chat_id}")
+            response = await self.client.post(url, json=payload)
+            if response.status_code == 400 and "can't parse entities" in response.text:
+                del payload["parse_mode"]
+                response = await self.client.post(url, json=payload)
+            response.raise_for_status()
             return True
             
         except Exception as e:
             logger.error(f"Error sending Telegram message: {e}")
             return False
     
+    async def send_streaming_message(self, chat_id: str, chunks: AsyncIterator[str]) -> str:
+        """
+        Stream a reply into a Telegram chat
+        The message is sent with the first text and edited as more arrives
+        
+        Args:
+            chat_id: Telegram chat ID
+            chunks: Async iterator of response text chunks
+        
+        Returns:
+            Complete reply text
+        """
+        parts = []
+        message_id = None
+        last_edit = 0.0
+        
+        async for chunk in chunks:
+            parts.append(chunk)
+            now = time.monotonic()
+            if now - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            
+            # Partial text is sent without Markdown, it may have unclosed entities
+            text = split_message("".join(parts))[0]
+            if not text.strip():
+                continue
+            if message_id is None:
+                message_id = await self._send_plain_message(chat_id, text)
+            else:
+                await self.edit_message(chat_id, message_id, text)
+            last_edit = now
+        
+        text = "".join(parts)
+        if not text.strip():
+            return text
+        
+        # Final text with Markdown, kept plain if it doesn't parse
+        first, *rest = split_message(text)
+        if message_id is None:
+            await self._send_chunk(chat_id, first)
+        elif not await self.edit_message(chat_id, message_id, first, parse_mode="Markdown"):
+            await self.edit_message(chat_id, message_id, first)
+        
+        # Overflow goes out as follow-up messages
+        for chunk in rest:
+            await self._send_chunk(chat_id, chunk)
+        
+        return text
+    
+    async def _send_plain_message(self, chat_id: str, text: str) -> Optional[int]:
+        """Send a plain text message and return its message ID"""
+        try:
+            response = await self.client.post(
+                f"{self.api_url}/sendMessage",
+                json={"chat_id": chat_id, "text": text}
+            )
+            response.raise_for_status()
+            return response.json()["result"]["message_id"]
+            
+        except Exception as e:
+            logger.error(f"Error sending Telegram message: {e}")
+            return None
+    
+    async def edit_message(
+        self,
+        chat_id: str,
+        message_id: int,
+        text: str,
+        parse_mode: Optional[str] = None
+    ) -> bool:
+        """
+        Replace the text of a sent message
+        
+        Args:
+            chat_id: Telegram chat ID
+            message_id: ID of the message to edit
+            text: New message text
+            parse_mode: Optional Telegram parse mode
+        
+        Returns:
+            True if successful (or the text was unchanged), False otherwise
+        """
+        try:
+            payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+            if parse_mode:
+                payload["parse_mode"] = parse_mode
+            
+            response = await self.client.post(f"{self.api_url}/editMessageText", json=payload)
+            if response.status_code == 400 and "not modified" in response.text:
+                return True
+            response.raise_for_status()
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error editing Telegram message: {e}")
+            return False
+    
     async def set_webhook(self, webhook_url: Optional[str] = None) -> bool:
         """
         Set Telegram webhook URL
@@ -75,10 +236,9 @@ class TelegramService:
             url = f"{self.api_url}/setWebhook"
             payload = {"url": url_to_set}
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                result = response.json()
+            response = await self.client.post(url, json=payload)
+            response.raise_for_status()
+            result = response.json()
             
             if result.get("ok"):
                 logger.info(f"Telegram webhook set: {url_to_set}")
@@ -99,9 +259,8 @@ class TelegramService:
         try:
             url = f"{self.api_url}/deleteWebhook"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url)
-                response.raise_for_status()
+            response = await self.client.post(url)
+            response.raise_for_status()
             
             logger.info("Telegram webhook deleted")
             return True
@@ -118,10 +277,9 @@ class TelegramService:
         try:
             url = f"{self.api_url}/getWebhookInfo"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                result = response.json()
+            response = await self.client.get(url)
+            response.raise_for_status()
+            result = response.json()
             
             return result.get("result", {})
             
@@ -129,6 +287,10 @@ class TelegramService:
             logger.error(f"Error getting webhook info: {e}")
             return {}
     
+    async def close(self):
+        """Close the HTTP client"""
+        await self.client.aclose()
+    
     def parse_webhook_data(self, data: Dict) -> Dict:
         """
         Parse incoming webhook data from Telegram
@@ -1,18 +1,34 @@
-from twilio.rest import Client
-from twilio.twiml.messaging_response import MessagingResponse
+import httpx
 from typing import Dict
+from xml.sax.saxutils import escape
 from app.core.config import settings
 from app.utils.logger import logger
 
+# TwiML for a single reply message
+TWIML_TEMPLATE = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>{}</Message></Response>'
+
+ERROR_MESSAGE = "Sorry, I encountered an error. Please try again later."
+
+# Pre-encoded reply for the webhook error path
+TWIML_ERROR = TWIML_TEMPLATE.format(ERROR_MESSAGE).encode()
+
+# Pre-encoded acknowledgement without a reply (sent later via the REST API)
+TWIML_EMPTY = b'<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
 
 class WhatsAppService:
     """Service for WhatsApp integration via Twilio"""
     
     def __init__(self):
         if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-            self.client = Client(
-                settings.TWILIO_ACCOUNT_SID,
-                settings.TWILIO_AUTH_TOKEN
+            # Persistent async client for the Twilio REST API (no thread hop,
+            # connections are kept alive across sends)
+            self.client = httpx.AsyncClient(
+                base_url=f"https://api.twilio.com/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}",
+                auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+                http2=True,
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(max_keepalive_connections=32)
             )
             self.from_number = settings.TWILIO_WHATSAPP_NUMBER
             logger.info("Twilio WhatsApp client initialized")
@@ -20,7 +36,7 @@ class WhatsAppService:
             self.client = None
             logger.warning("Twilio credentials not found. WhatsApp disabled.")
     
-    def send_message(self, to_number: str, message: str) -> bool:
+    async def send_message(self, to_number: str, message: str) -> bool:
         """
         Send WhatsApp message via Twilio
         
@@ -40,19 +56,28 @@ class WhatsAppService:
             if not to_number.startswith("whatsapp:"):
                 to_number = f"whatsapp:{to_number}"
             
-            message = self.client.messages.create(
-                from_=self.from_number,
-                body=message,
-                to=to_number
+            response = await self.client.post(
+                "/Messages.json",
+                data={
+                    "From": self.from_number,
+                    "To": to_number,
+                    "Body": message
+                }
             )
+            response.raise_for_status()
             
-            logger.info(f"WhatsApp message sent: {message.sid}")
+            logger.info(f"WhatsApp message sent: {response.json().get('sid')}")
             return True
             
         except Exception as e:
             logger.error(f"Error sending WhatsApp message: {e}")
             return False
     
+    async def close(self):
+        """Close the HTTP client"""
+        if self.client:
+            await self.client.aclose()
+    
     def create_response(self, message: str) -> str:
         """
         Create TwiML response for webhook
@@ -63,9 +88,7 @@ class WhatsAppService:
         Returns:
             TwiML XML string
         """
-        response = MessagingResponse()
-        response.message(message)
-        return str(response)
+        return TWIML_TEMPLATE.format(escape(message))
     
     def parse_webhook_data(self, form_data: Dict) -> Dict:
         """
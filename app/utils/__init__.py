@@ -1,3 +1,4 @@
 from app.utils.logger import logger
 from app.utils.cache import cache_manager
+from app.utils.semantic_cache import semantic_cache
 from app.utils.helpers import *
\ No newline at end of file
@@ -1,77 +1,218 @@
-import redis
-import json
-from typing import Optional, Any
+import asyncio
+import orjson
+import redis.asyncio as aioredis
+from typing import Any, Dict, List, Optional, Tuple
 from app.core.config import settings
 from app.utils.logger import logger
 
+# Shared asyncio connection pool (cache and rate limiter) with keepalive
+# sockets. Not the blocking pool: on redis 5.0.1 its asyncio version
+# deadlocks when a connect fails. Past max_connections a call errors
+# out, which callers treat as a cache miss
+redis_pool = aioredis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_connect_timeout=1,
+    socket_timeout=1,
+    socket_keepalive=True,
+    health_check_interval=30
+)
+
+# Write-behind queue: entries per pipelined flush, pending entries before new ones are dropped
+WRITE_BATCH_SIZE = 100
+WRITE_QUEUE_SIZE = 10_000
+
+# Keys per SCAN step and per UNLINK in clear_pattern
+SCAN_BATCH_SIZE = 500
+
 
 class CacheManager:
     """Redis cache manager"""
     
     def __init__(self):
+        # Values are raw bytes (the pool doesn't decode), serialized with orjson
+        self.redis_client = aioredis.Redis(connection_pool=redis_pool)
+        
+        # (key, serialized value, expire) written by a background task,
+        # both created on first use inside the event loop
+        self._write_queue: Optional["asyncio.Queue[Tuple[str, bytes, int]]"] = None
+        self._writer: Optional[asyncio.Task] = None
+    
+    async def connect(self):
+        """Check the Redis connection (called at startup), caching is disabled if it fails"""
         try:
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                decode_responses=True
-            )
-            self.redis_client.ping()
+            await self.redis_client.ping()
             logger.info("Redis connected successfully")
         except Exception as e:
             logger.warning(f"Redis connection failed: {e}. Caching disabled.")
             self.redis_client = None
     
-    def get(self, key: str) -> Optional[Any]:
+    async def close(self):
+        """Flush queued writes and close pooled Redis connections"""
+        if self._writer:
+            try:
+                await asyncio.wait_for(self._write_queue.join(), timeout=5)
+            except asyncio.TimeoutError:
+                logger.warning("Cache write queue not flushed before shutdown")
+            self._writer.cancel()
+            self._writer = None
+        
+        await redis_pool.disconnect()
+    
+    async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         if not self.redis_client:
             return None
         
         try:
-            value = self.redis_client.get(key)
+            value = await self.redis_client.get(key)
             if value:
-                return json.loads(value)
+                return orjson.loads(value)
             return None
         except Exception as e:
             logger.error(f"Cache get error: {e}")
             return None
     
-    def set(self, key: str, value: Any, expire: int = 3600) -> bool:
+    async def set(self, key: str, value: Any, expire: int = 3600) -> bool:
         """Set value in cache with expiration (seconds)"""
         if not self.redis_client:
             return False
         
         try:
-            self.redis_client.setex(
+            await self.redis_client.setex(
                 key,
                 expire,
-                json.dumps(value)
+                orjson.dumps(value)
             )
             return True
         except Exception as e:
             logger.error(f"Cache set error: {e}")
             return False
     
-    def delete(self, key: str) -> bool:
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get many values in one round trip (None for missing keys)"""
+        if not self.redis_client or not keys:
+            return [None] * len(keys)
+        
+        try:
+            return [
+                orjson.loads(value) if value else None
+                for value in await self.redis_client.mget(keys)
+            ]
+        except Exception as e:
+            logger.error(f"Cache mget error: {e}")
+            return [None] * len(keys)
+    
+    def set_nowait(self, key: str, value: Any, expire: int = 3600):
+        """
+        Queue a value to be cached without waiting for Redis
+        For writes the caller doesn't depend on; queued entries are
+        flushed in pipelined batches by a background task
+        """
+        if not self.redis_client:
+            return
+        
+        if self._writer is None:
+            self._write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+            self._writer = asyncio.create_task(self._drain_writes())
+        
+        try:
+            self._write_queue.put_nowait((key, orjson.dumps(value), expire))
+        except asyncio.QueueFull:
+            logger.warning("Cache write queue full, dropping write")
+        except Exception as e:
+            logger.error(f"Cache set error: {e}")
+    
+    async def _drain_writes(self):
+        """Write queued entries, batching whatever has piled up into one pipeline"""
+        queue = self._write_queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, value, expire in batch:
+                        pipe.setex(key, expire, value)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Cache write-behind error: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    async def mset(self, mapping: Dict[str, Any], expire: int = 3600) -> bool:
+        """Set many values with expiration (seconds) in one round trip"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            # MSET can't expire keys, so SETEX commands are pipelined instead
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.setex(key, expire, orjson.dumps(value))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Cache mset error: {e}")
+            return False
+    
+    async def incr(self, key: str) -> Optional[int]:
+        """Increment an integer counter (created at 0)"""
+        if not self.redis_client:
+            return None
+        
+        try:
+            return await self.redis_client.incr(key)
+        except Exception as e:
+            logger.error(f"Cache incr error: {e}")
+            return None
+    
+    async def delete(self, key: str) -> bool:
         """Delete key from cache"""
         if not self.redis_client:
             return False
         
         try:
-            self.redis_client.delete(key)
+            await self.redis_client.delete(key)
             return True
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
             return False
     
-    def clear_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern"""
-        if not self.redis_client:
+    async def mdelete(self, keys: List[str]) -> int:
+        """Delete many keys in one round trip, returns the number deleted"""
+        if not self.redis_client or not keys:
             return 0
         
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
+            return await self.redis_client.delete(*keys)
+        except Exception as e:
+            logger.error(f"Cache mdelete error: {e}")
             return 0
+    
+    async def clear_pattern(self, pattern: str) -> int:
+        """
+        Delete all keys matching pattern
+        Not atomic: keys written while the scan runs may or may not be deleted
+        """
+        if not self.redis_client:
+            return 0
+        
+        try:
+            # SCAN walks the keyspace incrementally (KEYS blocks the server),
+            # each batch is unlinked with the memory freed in the background
+            deleted = 0
+            batch = []
+            async for key in self.redis_client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) == SCAN_BATCH_SIZE:
+                    deleted += await self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += await self.redis_client.unlink(*batch)
+            return deleted
         except Exception as e:
             logger.error(f"Cache clear pattern error: {e}")
             return 0
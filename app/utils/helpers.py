@@ -1,12 +1,44 @@
+import base64
 import hashlib
-import uuid
+import os
+import string
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional, Tuple
+
+# Every ASCII byte except digits and "+", deleted by bytes.translate in one C-level pass
+_PHONE_STRIP = bytes(i for i in range(128) if chr(i) not in string.digits + "+")
+
+# (epoch second, its "YYYY-MM-DDTHH:MM:SS" prefix) for format_timestamp
+_timestamp_prefix: Tuple[int, str] = (-1, "")
+
+# OS randomness read 4 KiB at a time and handed out 16 bytes per session ID
+_SESSION_ID_BYTES = 16
+_random_pool = b""
+_random_offset = 0
+
+
+def _reset_random_pool():
+    """Drop buffered randomness so a forked child never reuses the parent's"""
+    global _random_pool, _random_offset
+    _random_pool, _random_offset = b"", 0
+
+
+os.register_at_fork(after_in_child=_reset_random_pool)
 
 
 def generate_session_id() -> str:
-    """Generate unique session ID"""
-    return str(uuid.uuid4())
+    """
+    Generate unique session ID (128 random bits, 22 URL-safe characters)
+    One urandom read serves 256 IDs
+    """
+    global _random_pool, _random_offset
+    if _random_offset >= len(_random_pool):
+        _random_pool, _random_offset = os.urandom(4096), 0
+    
+    chunk = _random_pool[_random_offset:_random_offset + _SESSION_ID_BYTES]
+    _random_offset += _SESSION_ID_BYTES
+    return base64.urlsafe_b64encode(chunk).rstrip(b"=").decode()
 
 
 def get_cache_key(prefix: str, identifier: str) -> str:
@@ -14,28 +46,71 @@ def get_cache_key(prefix: str, identifier: str) -> str:
     return f"{prefix}:{identifier}"
 
 
+def make_key_builder(prefix: str) -> Callable[[str], str]:
+    """
+    Specialize get_cache_key for one prefix
+    The "prefix:" head is built once, each key is a single concatenation
+    """
+    head = f"{prefix}:"
+    
+    def build(identifier: str) -> str:
+        return head + identifier
+    
+    return build
+
+
+# Key builders for cache prefixes used across the app
+ai_response_key = make_key_builder("ai_response")
+
+
 def hash_string(text: str) -> str:
-    """Generate SHA256 hash of string"""
-    return hashlib.sha256(text.encode()).hexdigest()
+    """Generate a 128-bit BLAKE2b hash of string (for keys, not security)"""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
 
 def format_timestamp(dt: Optional[datetime] = None) -> str:
     """Format datetime to ISO string"""
-    if dt is None:
-        dt = datetime.utcnow()
-    return dt.isoformat()
+    if dt is not None:
+        return dt.isoformat()
+    
+    # Current UTC time: the seconds part is formatted once per second
+    global _timestamp_prefix
+    now_us = time.time_ns() // 1000
+    seconds, micros = divmod(now_us, 1_000_000)
+    if _timestamp_prefix[0] != seconds:
+        _timestamp_prefix = (seconds, datetime.utcfromtimestamp(seconds).isoformat())
+    
+    # Same output as isoformat(), which omits a zero microsecond part
+    if micros:
+        return f"{_timestamp_prefix[1]}.{micros:06d}"
+    return _timestamp_prefix[1]
 
 
 def clean_phone_number(phone: str) -> str:
     """Clean and format phone number"""
     # Remove whatsapp: prefix if exists
-    phone = phone.replace("whatsapp:", "")
+    phone = phone.removeprefix("whatsapp:")
     # Remove all non-numeric characters except +
+    if phone.isascii():
+        return phone.encode().translate(None, _PHONE_STRIP).decode()
     return ''.join(c for c in phone if c.isdigit() or c == '+')
 
 
 def truncate_text(text: str, max_length: int = 100) -> str:
     """Truncate text to max length"""
-    if len(text) <= max_length:
-        return text
-    return text[:max_length-3] + "..."
\ No newline at end of file
+    return text if len(text) <= max_length else f"{text[:max_length - 3]}..."
+
+
+def truncate_bytes(data: bytes, max_length: int = 100) -> bytes:
+    """Truncate UTF-8 bytes to max length without splitting a character"""
+    if len(data) <= max_length:
+        return data
+    
+    # Below 3 bytes there's no room for the ellipsis, the data is only cut
+    ellipsis = b"..." if max_length >= 3 else b""
+    
+    # Back up past continuation bytes (0b10xxxxxx) to a character boundary
+    end = max(max_length - len(ellipsis), 0)
+    while end > 0 and data[end] & 0xC0 == 0x80:
+        end -= 1
+    return data[:end] + ellipsis
\ No newline at end of file
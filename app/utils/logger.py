@@ -1,8 +1,29 @@
 import logging
+import logging.handlers
+import queue
 import sys
-from pythonjsonlogger import jsonlogger
+import orjson
 from app.core.config import settings
 
+
+class OrjsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, serialized with orjson
+    Same keys as the previous python-json-logger output
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "asctime": self.formatTime(record),
+            "name": record.name,
+            "levelname": record.levelname,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(payload).decode()
+
+
 # Create logger
 logger = logging.getLogger("chatbot")
 logger.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
@@ -17,9 +38,32 @@ if settings.DEBUG:
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 else:
-    formatter = jsonlogger.JsonFormatter(
-        '%(asctime)s %(name)s %(levelname)s %(message)s'
-    )
+    formatter = OrjsonFormatter()
 
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
\ No newline at end of file
+
+# Outside the app lifespan records are written to stdout directly. While the
+# app runs they are queued and written by a background thread instead, so
+# request handlers never block on the write
+logger.addHandler(console_handler)
+
+log_queue = queue.SimpleQueue()
+queue_handler = logging.handlers.QueueHandler(log_queue)
+
+log_listener = logging.handlers.QueueListener(
+    log_queue, console_handler, respect_handler_level=True
+)
+
+
+def start_log_listener():
+    """Start the writer thread and route records through the queue"""
+    log_listener.start()
+    logger.addHandler(queue_handler)
+    logger.removeHandler(console_handler)
+
+
+def stop_log_listener():
+    """Write records directly again, then flush the queue and stop the thread"""
+    logger.addHandler(console_handler)
+    logger.removeHandler(queue_handler)
+    log_listener.stop()
\ No newline at end of file
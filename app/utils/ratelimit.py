@@ -0,0 +1,41 @@
+import asyncio
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket for outbound request rates
+    Refills at `rate` tokens per second up to `burst`; waiters are served in order
+    """
+    
+    __slots__ = ("rate", "burst", "tokens", "updated", "_lock")
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+    
+    def _refill(self, now: float):
+        """Add the tokens accrued since the last update"""
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, n: float = 1):
+        """Wait until n tokens are available and take them"""
+        loop = asyncio.get_running_loop()
+        
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                self._refill(loop.time())
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+    
+    def release(self, n: float = 1):
+        """Return unused tokens (e.g. the request never reached the provider)"""
+        self.tokens = min(self.burst, self.tokens + n)
\ No newline at end of file
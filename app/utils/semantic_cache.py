@@ -0,0 +1,301 @@
+import bisect
+import os
+import pickle
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.logger import logger
+
+try:
+    import faiss
+except ImportError:  # optional, brute-force search is used without it
+    faiss = None
+
+
+class _Namespace:
+    """Cached responses for a single platform"""
+    
+    def __init__(self):
+        # normalized text -> (response, expires_at), in insertion order
+        self.exact: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        
+        # L2-normalized embeddings, one row per response; the buffer doubles
+        # when full and only the first `size` rows are live
+        self.buffer: Optional[np.ndarray] = None
+        self.size = 0
+        self.responses: List[str] = []
+        self.expires: List[float] = []
+        
+        # Optional HNSW index over vectors; index id - dropped = row
+        self.index = None
+        self.dropped = 0
+    
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """Live rows of the embedding buffer"""
+        if not self.size:
+            return None
+        return self.buffer[:self.size]
+    
+    def __getstate__(self):
+        # The index is rebuilt on demand and spare buffer rows are dropped
+        state = self.__dict__.copy()
+        state["buffer"] = self.vectors
+        state["index"] = None
+        state["dropped"] = 0
+        return state
+    
+    def __setstate__(self, state):
+        # Files saved before the growable buffer stored the rows as "vectors"
+        if "vectors" in state:
+            state["buffer"] = state.pop("vectors")
+            state["size"] = len(state["responses"]) if state["buffer"] is not None else 0
+        self.__dict__.update(state)
+    
+    def add(self, vector: np.ndarray, response: str, expires_at: float):
+        """Append a row, growing the buffer by doubling when it is full"""
+        if self.buffer is None or self.buffer.shape[1] != vector.shape[0]:
+            # First entry or embedding model changed
+            self.buffer = np.empty((16, vector.shape[0]), dtype=np.float32)
+            self.size = 0
+            self.responses = []
+            self.expires = []
+            self.index = None
+        elif self.size == self.buffer.shape[0]:
+            grown = np.empty((self.size * 2, self.buffer.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.buffer
+            self.buffer = grown
+        
+        self.buffer[self.size] = vector
+        self.size += 1
+        self.responses.append(response)
+        self.expires.append(expires_at)
+        if self.index is not None:
+            self.index.add(vector.reshape(1, -1))
+    
+    def build_index(self):
+        """(Re)build the HNSW index over the current vectors"""
+        index = faiss.IndexHNSWFlat(self.buffer.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        index.add(self.vectors)
+        self.index = index
+        self.dropped = 0
+    
+    def evict(self, now: float, max_entries: int):
+        """Drop expired entries and trim to max_entries (oldest first)"""
+        while self.exact:
+            _, (_, expires_at) = next(iter(self.exact.items()))
+            if expires_at > now and len(self.exact) <= max_entries:
+                break
+            self.exact.popitem(last=False)
+        
+        # TTL is constant, so expired rows always form a prefix
+        expired = bisect.bisect_right(self.expires, now)
+        overflow = max(0, self.size - expired - max_entries)
+        drop = expired + overflow
+        
+        if drop:
+            # Compact the live rows to the front of the buffer in place
+            keep = self.size - drop
+            if keep:
+                self.buffer[:keep] = self.buffer[drop:self.size]
+            self.size = keep
+            del self.responses[:drop]
+            del self.expires[:drop]
+            
+            # HNSW can't delete, evicted rows are skipped until the next rebuild
+            if not keep:
+                self.index = None
+            self.dropped += drop
+
+
+class SemanticResponseCache:
+    """
+    In-process semantic cache for AI responses
+    Serves near-duplicate questions from memory instead of calling the AI provider
+    """
+    
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        ttl: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED
+        self.threshold = threshold or settings.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = ttl or settings.SEMANTIC_CACHE_TTL
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.ann_min_entries = settings.SEMANTIC_CACHE_ANN_MIN_ENTRIES
+        
+        # Namespaces never grow past max_entries, so a higher threshold would never be reached
+        if self.ann_min_entries > self.max_entries:
+            logger.warning(
+                f"SEMANTIC_CACHE_ANN_MIN_ENTRIES ({self.ann_min_entries}) exceeds "
+                f"SEMANTIC_CACHE_MAX_ENTRIES ({self.max_entries}), using {self.max_entries}"
+            )
+            self.ann_min_entries = self.max_entries
+        self._namespaces: Dict[str, _Namespace] = {}
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text for exact matching"""
+        return " ".join(text.lower().split())
+    
+    @staticmethod
+    def _to_unit_vector(embedding: List[float]) -> Optional[np.ndarray]:
+        """Convert embedding to an L2-normalized float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+    
+    async def lookup(
+        self,
+        platform: str,
+        text: str,
+        embed: Callable[[str], Awaitable[List[float]]]
+    ) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        Find a cached response for a message
+        The message is only embedded when there is no exact match
+        
+        Args:
+            platform: Platform namespace (website, whatsapp, telegram)
+            text: User message
+            embed: Async function returning the embedding of a text
+        
+        Returns:
+            (cached response or None on miss, message embedding or None)
+        """
+        if not self.enabled:
+            return None, None
+        
+        namespace = self._namespaces.get(platform)
+        
+        # Exact match on normalized text
+        if namespace is not None:
+            namespace.evict(time.time(), self.max_entries)
+            entry = namespace.exact.get(self.normalize(text))
+            if entry:
+                logger.info(f"Semantic cache exact hit ({platform})")
+                return entry[0], None
+        
+        # Embedding is also returned so a miss can be stored afterwards
+        embedding = await embed(text)
+        if not embedding or namespace is None or namespace.vectors is None:
+            return None, embedding
+        
+        query = self._to_unit_vector(embedding)
+        if query is None or query.shape[0] != namespace.vectors.shape[1]:
+            return None, embedding
+        
+        score, best = self._search(namespace, query)
+        
+        if score >= self.threshold:
+            logger.info(f"Semantic cache hit ({platform}, score={score:.3f})")
+            return namespace.responses[best], embedding
+        
+        return None, embedding
+    
+    def _search(self, namespace: _Namespace, query: np.ndarray) -> Tuple[float, int]:
+        """
+        Find the most similar cached vector
+        
+        Returns:
+            (cosine similarity, row) or (-1.0, -1) if nothing was found
+        """
+        # Brute force is faster than HNSW for small namespaces
+        if faiss is None or namespace.size < self.ann_min_entries:
+            # Vectors are unit length, so the dot product is cosine similarity
+            scores = namespace.vectors @ query
+            best = int(np.argmax(scores))
+            return float(scores[best]), best
+        
+        # Rebuild once evicted rows outnumber live ones
+        if namespace.index is None or namespace.dropped > len(namespace.responses):
+            namespace.build_index()
+        
+        scores, ids = namespace.index.search(query.reshape(1, -1), 8)
+        for score, index_id in zip(scores[0], ids[0]):
+            row = int(index_id) - namespace.dropped
+            if index_id >= 0 and row >= 0:
+                return float(score), row
+        
+        return -1.0, -1
+    
+    def store(
+        self,
+        platform: str,
+        text: str,
+        embedding: Optional[List[float]],
+        response: str
+    ):
+        """
+        Cache a response for a message
+        
+        Args:
+            platform: Platform namespace (website, whatsapp, telegram)
+            text: User message
+            embedding: Embedding of the user message (optional)
+            response: AI response to cache
+        """
+        if not self.enabled or not response:
+            return
+        
+        now = time.time()
+        expires_at = now + self.ttl
+        namespace = self._namespaces.setdefault(platform, _Namespace())
+        
+        key = self.normalize(text)
+        namespace.exact.pop(key, None)
+        namespace.exact[key] = (response, expires_at)
+        
+        vector = self._to_unit_vector(embedding) if embedding else None
+        if vector is not None:
+            namespace.add(vector, response, expires_at)
+        
+        namespace.evict(now, self.max_entries)
+    
+    def clear(self, platform: Optional[str] = None):
+        """Clear cached responses for one platform or all of them"""
+        if platform:
+            self._namespaces.pop(platform, None)
+        else:
+            self._namespaces.clear()
+    
+    def save(self, path: str):
+        """Persist cached entries to a file"""
+        try:
+            # Per-process temp file, workers shutting down together each
+            # replace the file atomically (the last one wins)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._namespaces, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            logger.info(f"Semantic cache saved to {path}")
+        except Exception as e:
+            logger.error(f"Error saving semantic cache: {e}")
+    
+    def load(self, path: str):
+        """Load cached entries saved by save() (expired entries are dropped)"""
+        if not os.path.exists(path):
+            return
+        
+        try:
+            with open(path, "rb") as f:
+                self._namespaces = pickle.load(f)
+            
+            now = time.time()
+            for namespace in self._namespaces.values():
+                namespace.evict(now, self.max_entries)
+            logger.info(f"Semantic cache loaded from {path}")
+        except Exception as e:
+            logger.error(f"Error loading semantic cache: {e}")
+
+
+# Global semantic cache instance
+semantic_cache = SemanticResponseCache()
\ No newline at end of file
@@ -1,12 +1,31 @@
-from fastapi import FastAPI
+import asyncio
+import orjson
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
-from app.api import website, whatsapp, telegram
+from app.api import website
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, close_db, db_ready
 from app.middleware.rate_limiter import RateLimiter
 from app.middleware.error_handler import setup_exception_handlers
-from app.utils.logger import logger
+from app.middleware.health import HealthCheck
+from app.services.ai_service import AIService
+from app.utils.cache import cache_manager
+from app.utils.logger import logger, start_log_listener, stop_log_listener
+from app.utils.semantic_cache import semantic_cache
+
+
+async def initialize_database():
+    """Create database tables (run as a startup background task)"""
+    try:
+        await init_db()
+        logger.info("✅ Database initialized successfully")
+    except Exception as e:
+        logger.error(f"❌ Database initialization failed: {e}")
+        logger.warning("⚠️  Continuing without database...")
+    finally:
+        db_ready.set()
 
 
 @asynccontextmanager
@@ -14,6 +33,9 @@ async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup and shutdown events
     """
+    # Write queued log records from a background thread
+    start_log_listener()
+    
     # Startup
     logger.info("=" * 50)
     logger.info("Starting AI Chatbot System...")
@@ -22,13 +44,29 @@ async def lifespan(app: FastAPI):
     logger.info(f"Debug Mode: {settings.DEBUG}")
     logger.info("=" * 50)
     
-    # Initialize database
-    try:
-        init_db()
-        logger.info("✅ Database initialized successfully")
-    except Exception as e:
-        logger.error(f"❌ Database initialization failed: {e}")
-        logger.warning("⚠️  Continuing without database...")
+    # Initialize database in the background, the app starts serving
+    # (e.g. health checks) without waiting for it; database users wait on db_ready
+    db_ready.clear()
+    db_init = asyncio.create_task(initialize_database())
+    
+    # Check Redis (caching is disabled if it's unreachable)
+    await cache_manager.connect()
+    
+    # Restore semantic cache from the previous run
+    if settings.SEMANTIC_CACHE_PATH:
+        semantic_cache.load(settings.SEMANTIC_CACHE_PATH)
+    
+    # Shared service instances (reused across requests)
+    app.state.ai_service = AIService()
+    
+    # Platform clients only for configured platforms, like their routers
+    if settings.TELEGRAM_BOT_TOKEN:
+        from app.services.telegram_service import TelegramService
+        app.state.telegram_service = TelegramService()
+    
+    if settings.TWILIO_ACCOUNT_SID:
+        from app.services.whatsapp_service import WhatsAppService
+        app.state.whatsapp_service = WhatsAppService()
     
     yield
     
@@ -36,6 +74,21 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 50)
     logger.info("Shutting down AI Chatbot System...")
     logger.info("=" * 50)
+    
+    if settings.SEMANTIC_CACHE_PATH:
+        semantic_cache.save(settings.SEMANTIC_CACHE_PATH)
+    
+    for name in ("telegram_service", "whatsapp_service", "ai_service"):
+        service = getattr(app.state, name, None)
+        if service is not None:
+            await service.close()
+    await cache_manager.close()
+    
+    db_init.cancel()
+    await close_db()
+    
+    # Flush remaining log records
+    stop_log_listener()
 
 
 # Create FastAPI app
@@ -54,6 +107,7 @@ app = FastAPI(
     """,
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc",
     contact={
@@ -73,8 +127,8 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
+    allow_headers=["content-type", "authorization"],
     expose_headers=["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"]
 )
 
@@ -88,17 +142,126 @@ app.include_router(
     tags=["Website Chat"]
 )
 
-app.include_router(
-    whatsapp.router,
-    prefix="/whatsapp",
-    tags=["WhatsApp"]
-)
+# Platform routers are only imported and mounted when the platform is configured
+if settings.TWILIO_ACCOUNT_SID:
+    from app.api import whatsapp
+    
+    app.include_router(
+        whatsapp.router,
+        prefix="/whatsapp",
+        tags=["WhatsApp"]
+    )
 
-app.include_router(
-    telegram.router,
-    prefix="/telegram",
-    tags=["Telegram"]
-)
+if settings.TELEGRAM_BOT_TOKEN:
+    from app.api import telegram
+    
+    app.include_router(
+        telegram.router,
+        prefix="/telegram",
+        tags=["Telegram"]
+    )
+
+
+# These payloads only depend on settings, so they're encoded once at import
+# and every request returns the same bytes
+ENDPOINTS = {
+    "website_chat": {
+        "send_message": "POST /api/chat/send",
+        "get_history": "GET /api/chat/history/{session_id}",
+        "delete_history": "DELETE /api/chat/history/{session_id}"
+    }
+}
+
+if settings.TWILIO_ACCOUNT_SID:
+    ENDPOINTS["whatsapp"] = {
+        "webhook": "POST /whatsapp/webhook",
+        "status": "GET /whatsapp/status",
+        "test": "POST /whatsapp/send-test"
+    }
+
+if settings.TELEGRAM_BOT_TOKEN:
+    ENDPOINTS["telegram"] = {
+        "webhook": "POST /telegram/webhook",
+        "setup": "GET /telegram/setup",
+        "status": "GET /telegram/status",
+        "test": "POST /telegram/send-test"
+    }
+
+ROOT_RESPONSE = orjson.dumps({
+    "message": "🤖 AI Chatbot System API",
+    "version": "1.0.0",
+    "status": "running",
+    "ai_provider": settings.AI_PROVIDER,
+    "ai_model": settings.AI_MODEL,
+    "documentation": {
+        "swagger": "/docs",
+        "redoc": "/redoc"
+    },
+    "endpoints": ENDPOINTS
+})
+
+HEALTH_RESPONSE = orjson.dumps({
+    "status": "healthy",
+    "service": "ai-chatbot-system",
+    "version": "1.0.0",
+    "ai_provider": settings.AI_PROVIDER,
+    "ai_model": settings.AI_MODEL,
+    "debug_mode": settings.DEBUG
+})
+
+INFO_RESPONSE = orjson.dumps({
+    "app_name": "AI Chatbot System",
+    "version": "1.0.0",
+    "description": "Multi-platform AI chatbot with FastAPI",
+    "ai_config": {
+        "provider": settings.AI_PROVIDER,
+        "model": settings.AI_MODEL,
+        "max_history": settings.MAX_CONVERSATION_HISTORY,
+        "temperature": settings.TEMPERATURE
+    },
+    "platforms": [
+        {
+            "name": "Website",
+            "status": "active",
+            "endpoint": "/api/chat/send"
+        },
+        {
+            "name": "WhatsApp",
+            "status": "active" if settings.TWILIO_ACCOUNT_SID else "inactive",
+            "endpoint": "/whatsapp/webhook"
+        },
+        {
+            "name": "Telegram",
+            "status": "active" if settings.TELEGRAM_BOT_TOKEN else "inactive",
+            "endpoint": "/telegram/webhook"
+        }
+    ],
+    "features": [
+        "Multi-platform support",
+        "Conversation history",
+        "Knowledge base (RAG)",
+        "Rate limiting",
+        "Redis caching",
+        "PostgreSQL database"
+    ]
+})
+
+CONFIG_RESPONSE = orjson.dumps({
+    "ai_provider": settings.AI_PROVIDER,
+    "ai_model": settings.AI_MODEL,
+    "max_conversation_history": settings.MAX_CONVERSATION_HISTORY,
+    "temperature": settings.TEMPERATURE,
+    "max_tokens": settings.MAX_TOKENS,
+    "rate_limit_per_minute": settings.RATE_LIMIT_PER_MINUTE,
+    "debug_mode": settings.DEBUG,
+    "whatsapp_configured": bool(settings.TWILIO_ACCOUNT_SID),
+    "telegram_configured": bool(settings.TELEGRAM_BOT_TOKEN),
+    "redis_configured": bool(settings.REDIS_URL)
+})
+
+# Health checks are answered by the outermost middleware, before CORS and
+# rate limiting (the /health route below stays for the API docs)
+app.add_middleware(HealthCheck, body=HEALTH_RESPONSE)
 
 
 @app.get("/", tags=["Root"])
@@ -106,35 +269,7 @@ async def root():
     """
     Root endpoint - API information
     """
-    return {
-        "message": "🤖 AI Chatbot System API",
-        "version": "1.0.0",
-        "status": "running",
-        "ai_provider": settings.AI_PROVIDER,
-        "ai_model": settings.AI_MODEL,
-        "documentation": {
-            "swagger": "/docs",
-            "redoc": "/redoc"
-        },
-        "endpoints": {
-            "website_chat": {
-                "send_message": "POST /api/chat/send",
-                "get_history": "GET /api/chat/history/{session_id}",
-                "delete_history": "DELETE /api/chat/history/{session_id}"
-            },
-            "whatsapp": {
-                "webhook": "POST /whatsapp/webhook",
-                "status": "GET /whatsapp/status",
-                "test": "POST /whatsapp/send-test"
-            },
-            "telegram": {
-                "webhook": "POST /telegram/webhook",
-                "setup": "GET /telegram/setup",
-                "status": "GET /telegram/status",
-                "test": "POST /telegram/send-test"
-            }
-        }
-    }
+    return Response(ROOT_RESPONSE, media_type="application/json")
 
 
 @app.get("/health", tags=["Health"])
@@ -142,14 +277,7 @@ async def health_check():
     """
     Health check endpoint
     """
-    return {
-        "status": "healthy",
-        "service": "ai-chatbot-system",
-        "version": "1.0.0",
-        "ai_provider": settings.AI_PROVIDER,
-        "ai_model": settings.AI_MODEL,
-        "debug_mode": settings.DEBUG
-    }
+    return Response(HEALTH_RESPONSE, media_type="application/json")
 
 
 @app.get("/info", tags=["Info"])
@@ -157,42 +285,7 @@ async def system_info():
     """
     Get detailed system information
     """
-    return {
-        "app_name": "AI Chatbot System",
-        "version": "1.0.0",
-        "description": "Multi-platform AI chatbot with FastAPI",
-        "ai_config": {
-            "provider": settings.AI_PROVIDER,
-            "model": settings.AI_MODEL,
-            "max_history": settings.MAX_CONVERSATION_HISTORY,
-            "temperature": settings.TEMPERATURE
-        },
-        "platforms": [
-            {
-                "name": "Website",
-                "status": "active",
-                "endpoint": "/api/chat/send"
-            },
-            {
-                "name": "WhatsApp",
-                "status": "active" if settings.TWILIO_ACCOUNT_SID else "inactive",
-                "endpoint": "/whatsapp/webhook"
-            },
-            {
-                "name": "Telegram",
-                "status": "active" if settings.TELEGRAM_BOT_TOKEN else "inactive",
-                "endpoint": "/telegram/webhook"
-            }
-        ],
-        "features": [
-            "Multi-platform support",
-            "Conversation history",
-            "Knowledge base (RAG)",
-            "Rate limiting",
-            "Redis caching",
-            "PostgreSQL database"
-        ]
-    }
+    return Response(INFO_RESPONSE, media_type="application/json")
 
 
 @app.get("/config", tags=["Config"])
@@ -200,29 +293,25 @@ async def get_config():
     """
     Get current configuration (non-sensitive)
     """
-    return {
-        "ai_provider": settings.AI_PROVIDER,
-        "ai_model": settings.AI_MODEL,
-        "max_conversation_history": settings.MAX_CONVERSATION_HISTORY,
-        "temperature": settings.TEMPERATURE,
-        "max_tokens": settings.MAX_TOKENS,
-        "rate_limit_per_minute": settings.RATE_LIMIT_PER_MINUTE,
-        "debug_mode": settings.DEBUG,
-        "whatsapp_configured": bool(settings.TWILIO_ACCOUNT_SID),
-        "telegram_configured": bool(settings.TELEGRAM_BOT_TOKEN),
-        "redis_configured": bool(settings.REDIS_URL)
-    }
+    return Response(CONFIG_RESPONSE, media_type="application/json")
 
 
 if __name__ == "__main__":
+    import os
     import uvicorn
     
     logger.info("Starting server directly...")
     
+    # uvicorn[standard] runs on uvloop and httptools when they're available;
+    # one worker per CPU unless reloading (reload needs a single process).
+    # The semantic cache, user id cache and in-memory rate limit fallback are
+    # per worker, set WEB_CONCURRENCY=1 to keep a single shared copy
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        workers=1 if settings.DEBUG else (settings.WEB_CONCURRENCY or os.cpu_count() or 1),
+        access_log=settings.DEBUG,
         log_level="info"
     )
\ No newline at end of file